@@ -5,9 +5,14 @@ from pathlib import Path
 
 from flask import Flask
 
+from .cli import registry_cli
 from .config import Config
-from .extensions import limiter
+from .extensions import http_client, limiter
 from .routes import register_routes
+from .services.alert_feed import start_poller
+from .services.nowplaying import start_watcher
+from .services.scrobbles import start_sync
+from .services.registry import sqlite_path
 from .utils.logging import configure_logging
 from .utils.storage import ensure_file_exists
 
@@ -19,12 +24,22 @@ def create_app(config_object: type[Config] | None = None) -> Flask:
 
     configure_logging(app)
     limiter.init_app(app)
+    http_client.init_app(app)
     register_routes(app)
+    app.cli.add_command(registry_cli)
 
     # Ensure required files exist so the application can operate.
-    ensure_file_exists(Path(app.config["DATABASE_FM"]))
+    if sqlite_path(app.config["DATABASE_FM"]) is None:
+        ensure_file_exists(Path(app.config["DATABASE_FM"]))
     ensure_file_exists(Path(app.config["LAST_GAME_ID_FILE"]))
 
+    @app.before_request
+    def start_background_tasks() -> None:
+        # Started lazily so CLI commands and imports do not spawn pollers.
+        start_poller(app)
+        start_watcher(app)
+        start_sync(app)
+
     @app.get("/")
     def root() -> tuple[dict[str, str], int]:
         return {"error": "Diretorio Invalido"}, 404
@@ -0,0 +1,16 @@
+"""ASGI entry point.
+
+Serves the Flask application from an ASGI server (``uvicorn app.asgi:asgi_app``)
+so that connection handling is event driven and a single process can hold
+hundreds of in-flight requests. Views still run synchronously, each on a thread
+of a dedicated pool sized by ``ASGI_WORKER_THREADS``; since they spend nearly
+all their time waiting on upstream I/O, threads are cheap to park there.
+"""
+from __future__ import annotations
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+
+asgi_app = WSGIMiddleware(app, workers=app.config["ASGI_WORKER_THREADS"])
@@ -0,0 +1,42 @@
+"""Flask CLI commands."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.services.registry import JournalRegistry, SqliteRegistry, sqlite_path
+
+
+registry_cli = AppGroup("registry", help="Manage the Last.fm registry.")
+
+
+@registry_cli.command("migrate")
+@click.option(
+    "--source",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="JSON snapshot to import (defaults to the bundled DATABASE_FM.json).",
+)
+@click.option(
+    "--target",
+    default=None,
+    help="sqlite:/// URI to write to (defaults to DATABASE_FM).",
+)
+def migrate_registry(source: Path | None, target: str | None) -> None:
+    """Copy the JSON registry (snapshot + journal) into SQLite."""
+    target = target or current_app.config["DATABASE_FM"]
+    database = sqlite_path(target)
+    if database is None:
+        raise click.UsageError(f"Target must be a sqlite:/// URI, got {target!r}")
+
+    source = source or Path(current_app.config["BASE_DIR"]) / "DATABASE_FM.json"
+    if not source.exists():
+        raise click.UsageError(f"Source registry {source} does not exist")
+
+    # Reading through JournalRegistry also replays any pending journal records.
+    entries = JournalRegistry(source).entries()
+    SqliteRegistry(database).import_entries(entries)
+    click.echo(f"Migrated {len(entries)} entries from {source} to {database}")
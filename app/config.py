@@ -23,24 +23,170 @@ class Config:
     LASTFM_API_KEY = os.getenv(
         "LASTFM_API_KEY", "afe79d2eec23a06e9b39a879b5427559"
     )
+    RAPIDAPI_KEY = os.getenv(
+        "RAPIDAPI_KEY", "8e941c6787mshba06793555144d9p16fa99jsn7fb15baa1a2e"
+    )
     IMGBB_API_KEY = os.getenv("IMGBB_API_KEY", "4170baf9ab968eeec13a3bc79553447a")
+    # Hosted thumbnails must outlive the pre-resolved alert feed.
+    IMGBB_EXPIRATION = int(os.getenv("IMGBB_EXPIRATION", str(24 * 3600)))
+    THUMBNAIL_SIZE = (1280, 720)
+    THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "85"))
+    THUMBNAIL_MAX_DOWNLOAD_BYTES = int(os.getenv("THUMBNAIL_MAX_DOWNLOAD_BYTES", str(15 * 1024**2)))
+    # Local image cache served from /temp_image; when enabled, Last.fm artwork
+    # URLs are rewritten to point at it. X-Sendfile hands serving to the proxy.
+    IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "false").lower() in {"1", "true", "yes"}
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", str(BASE_DIR / "temp_image"))
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024**2)))
+    IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "false").lower() in {"1", "true", "yes"}
     CHARACTER_AI_TOKEN = os.getenv(
         "CHARACTER_AI_TOKEN", "2f97b396ac603fe7e787952a68ecdf94988e5a3a"
     )
     CHARACTER_ID = os.getenv(
         "CHARACTER_ID", "zveWItgxoXlh19utBS7pt5rSEDnohG7B7QJeTPdvdL0"
     )
+    CHARACTER_AI_TIMEOUT = float(os.getenv("CHARACTER_AI_TIMEOUT", "60"))
+    # One Floppa chat per WhatsApp user/group, kept in a bounded, persisted LRU.
+    CHARACTER_AI_CHATS_FILE = os.getenv(
+        "CHARACTER_AI_CHATS_FILE", str(BASE_DIR / "character_ai_chats.json")
+    )
+    CHARACTER_AI_MAX_CHATS = int(os.getenv("CHARACTER_AI_MAX_CHATS", "1000"))
+    CHARACTER_AI_CHAT_IDLE_TTL = float(os.getenv("CHARACTER_AI_CHAT_IDLE_TTL", str(7 * 24 * 3600)))
+    # g4f inference pool: worker threads, queued requests and per-request deadline.
+    GPT_WORKERS = int(os.getenv("GPT_WORKERS", "4"))
+    GPT_QUEUE_SIZE = int(os.getenv("GPT_QUEUE_SIZE", "16"))
+    GPT_TIMEOUT = float(os.getenv("GPT_TIMEOUT", "60"))
+    # Provider scheduling: candidate g4f providers (empty = the model's defaults),
+    # how many to race per prompt, concurrent attempts per provider and the
+    # circuit-breaker settings.
+    GPT_PROVIDERS = [
+        name.strip() for name in os.getenv("GPT_PROVIDERS", "").split(",") if name.strip()
+    ]
+    GPT_PROVIDER_RACE = int(os.getenv("GPT_PROVIDER_RACE", "2"))
+    GPT_PROVIDER_MAX_IN_FLIGHT = int(os.getenv("GPT_PROVIDER_MAX_IN_FLIGHT", "4"))
+    GPT_PROVIDER_FAILURE_THRESHOLD = int(os.getenv("GPT_PROVIDER_FAILURE_THRESHOLD", "3"))
+    GPT_PROVIDER_COOLDOWN = float(os.getenv("GPT_PROVIDER_COOLDOWN", "120"))
+    # Completion cache: in-memory LRU plus an optional on-disk tier (empty dir = off).
+    GPT_CACHE_SIZE = int(os.getenv("GPT_CACHE_SIZE", "1024"))
+    GPT_CACHE_TTL = float(os.getenv("GPT_CACHE_TTL", "3600"))
+    GPT_CACHE_DIR = os.getenv("GPT_CACHE_DIR", "")
+    GPT_CACHE_DISK_TTL = float(os.getenv("GPT_CACHE_DISK_TTL", str(7 * 24 * 3600)))
+    GPT_CACHE_DISK_MAX_BYTES = int(os.getenv("GPT_CACHE_DISK_MAX_BYTES", str(64 * 1024**2)))
     BING_AUTH_TOKEN = os.getenv(
         "BING_AUTH_TOKEN",
         "1JyskSYHBQDULjRx0eiYm_tkkNQ8eDbZMoaPGk3iJlSH6i2bOHJgcs1hjAdE7-zSsQAcLSNM13ypKWA1v_jIy2tchnsvCBvcpMFUPV-jQo7hW8uCQcnKbi3NpB_eobTxylzYBGdsRA9Grv2fC_BcuAis1CjM8Z7GbDz2q78AZ2-_lK8txHghpJ4jY739F9haAnSKS6S0aRvx7ViOGwLFzXw",
     )
 
+    # Either a JSON snapshot path or a sqlite:/// URI (see app.services.registry).
     DATABASE_FM = os.getenv(
         "DATABASE_FM", str(BASE_DIR / "DATABASE_FM.json")
     )
+    # "journal" appends upserts to <DATABASE_FM>.journal; "json" rewrites the snapshot.
+    REGISTRY_STORAGE = os.getenv("REGISTRY_STORAGE", "journal")
+    # fsync policy for journal appends: "always", "interval" or "never".
+    REGISTRY_FSYNC = os.getenv("REGISTRY_FSYNC", "interval")
+    REGISTRY_FSYNC_INTERVAL = float(os.getenv("REGISTRY_FSYNC_INTERVAL", "1.0"))
+    REGISTRY_COMPACT_THRESHOLD = int(os.getenv("REGISTRY_COMPACT_THRESHOLD", "1000"))
     LAST_GAME_ID_FILE = os.getenv(
         "LAST_GAME_ID_FILE", str(BASE_DIR / "last_game_id.txt")
     )
+    # Pre-resolved free-game alerts; polled every FREESTUFF_POLL_INTERVAL seconds (0 = off).
+    ALERT_FEED_FILE = os.getenv("ALERT_FEED_FILE", str(BASE_DIR / "alert_feed.json"))
+    FREESTUFF_POLL_INTERVAL = float(os.getenv("FREESTUFF_POLL_INTERVAL", "120"))
+    FREESTUFF_RESOLVE_WORKERS = int(os.getenv("FREESTUFF_RESOLVE_WORKERS", "8"))
+    # Announced game ids (replaces LAST_GAME_ID_FILE, which is imported once).
+    SEEN_GAMES_FILE = os.getenv("SEEN_GAMES_FILE", str(BASE_DIR / "seen_games.json"))
+    SEEN_GAMES_TTL = float(os.getenv("SEEN_GAMES_TTL", str(60 * 24 * 3600)))
+    SEEN_GAMES_MAX = int(os.getenv("SEEN_GAMES_MAX", "5000"))
+
+    # Upstream HTTP client: pool sizes, retries and (connect, read) timeouts.
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+    HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+    HTTP_TIMEOUTS = {
+        "default": (3.05, 30.0),
+        "lastfm": (3.05, 10.0),
+        "freestuff": (3.05, 15.0),
+        "imgbb": (3.05, 30.0),
+        "images": (3.05, 15.0),
+        "rapidapi": (3.05, 30.0),
+        "callbacks": (3.05, 10.0),
+    }
+
+    # Last.fm response cache: LRU size and TTL (seconds) per API method.
+    LASTFM_CACHE_SIZE = int(os.getenv("LASTFM_CACHE_SIZE", "4096"))
+    LASTFM_CACHE_DEFAULT_TTL = 60
+    LASTFM_CACHE_TTLS = {
+        "user.getrecenttracks": 10,
+        "track.getInfo": 120,
+        "user.gettopalbums": 600,
+        "user.gettoptracks": 600,
+        "user.gettopartists": 600,
+    }
+    # Outbound Last.fm budget (requests/second, burst) shared by all workers via
+    # LASTFM_SHARED_DIR. Bulk calls leave BULK_RESERVE tokens for interactive
+    # ones, and calls wait up to QUEUE_TIMEOUT seconds for budget.
+    LASTFM_RATE_LIMIT = float(os.getenv("LASTFM_RATE_LIMIT", "5"))
+    LASTFM_RATE_BURST = float(os.getenv("LASTFM_RATE_BURST", "10"))
+    LASTFM_RATE_BULK_RESERVE = float(os.getenv("LASTFM_RATE_BULK_RESERVE", "3"))
+    LASTFM_RATE_QUEUE_TIMEOUT = float(os.getenv("LASTFM_RATE_QUEUE_TIMEOUT", "10"))
+    # /fm/group/recent: members per request, dedicated fan-out pool and deadline.
+    LASTFM_GROUP_MAX_NUMBERS = int(os.getenv("LASTFM_GROUP_MAX_NUMBERS", "256"))
+    LASTFM_GROUP_WORKERS = int(os.getenv("LASTFM_GROUP_WORKERS", "16"))
+    LASTFM_GROUP_TIMEOUT = float(os.getenv("LASTFM_GROUP_TIMEOUT", "25"))
+    # Top lists are served stale-while-revalidate past their TTL above, and the
+    # last known list stays available this long when Last.fm is unreachable.
+    LASTFM_STALE_TTL = int(os.getenv("LASTFM_STALE_TTL", str(24 * 3600)))
+    # Opt-in now-playing watcher: poll intervals for playing / idle users (idle
+    # ones back off up to MAX), and where changes go (SSE log and webhook).
+    NOWPLAYING_WATCH_ENABLED = (
+        os.getenv("NOWPLAYING_WATCH_ENABLED", "false").lower() in {"1", "true", "yes"}
+    )
+    NOWPLAYING_FAST_INTERVAL = float(os.getenv("NOWPLAYING_FAST_INTERVAL", "15"))
+    NOWPLAYING_IDLE_INTERVAL = float(os.getenv("NOWPLAYING_IDLE_INTERVAL", "60"))
+    NOWPLAYING_MAX_INTERVAL = float(os.getenv("NOWPLAYING_MAX_INTERVAL", "900"))
+    NOWPLAYING_WORKERS = int(os.getenv("NOWPLAYING_WORKERS", "4"))
+    NOWPLAYING_WEBHOOK_URL = os.getenv("NOWPLAYING_WEBHOOK_URL", "")
+    NOWPLAYING_EVENTS_FILE = os.getenv(
+        "NOWPLAYING_EVENTS_FILE", str(BASE_DIR / "nowplaying_events.json")
+    )
+    # Opt-in local scrobble counters: every SCROBBLE_SYNC_TICK seconds, users not
+    # synced for SCROBBLE_SYNC_INTERVAL get new scrobbles pulled, at most
+    # SCROBBLE_SYNC_MAX_PAGES pages per run (first ingests span several runs).
+    # Counters of the SCROBBLE_CACHE_SIZE most recently used users stay in memory.
+    SCROBBLE_STORE_ENABLED = (
+        os.getenv("SCROBBLE_STORE_ENABLED", "false").lower() in {"1", "true", "yes"}
+    )
+    SCROBBLE_STORE_DIR = os.getenv("SCROBBLE_STORE_DIR", str(BASE_DIR / "scrobbles"))
+    SCROBBLE_SYNC_TICK = float(os.getenv("SCROBBLE_SYNC_TICK", "30"))
+    SCROBBLE_SYNC_INTERVAL = float(os.getenv("SCROBBLE_SYNC_INTERVAL", "300"))
+    SCROBBLE_SYNC_MAX_PAGES = int(os.getenv("SCROBBLE_SYNC_MAX_PAGES", "25"))
+    SCROBBLE_CACHE_SIZE = int(os.getenv("SCROBBLE_CACHE_SIZE", "64"))
+    # Optional directory shared by worker processes so that only one of them
+    # calls Last.fm for a given request at a time (empty = per-process only).
+    LASTFM_SHARED_DIR = os.getenv("LASTFM_SHARED_DIR", "")
+
+    # Downloader results by canonical media URL. RapidAPI links are signed and
+    # expire, so keep the TTL well below their lifetime.
+    DOWNLOADER_CACHE_SIZE = int(os.getenv("DOWNLOADER_CACHE_SIZE", "1024"))
+    DOWNLOADER_CACHE_TTL = int(os.getenv("DOWNLOADER_CACHE_TTL", "600"))
+    # Asynchronous download jobs (async=1): worker pool, queue, how long job
+    # records are kept and which hosts may receive completion callbacks.
+    DOWNLOADER_WORKERS = int(os.getenv("DOWNLOADER_WORKERS", "8"))
+    DOWNLOADER_QUEUE_SIZE = int(os.getenv("DOWNLOADER_QUEUE_SIZE", "64"))
+    DOWNLOADER_JOBS_DIR = os.getenv("DOWNLOADER_JOBS_DIR", str(BASE_DIR / "downloader_jobs"))
+    DOWNLOADER_JOB_TTL = int(os.getenv("DOWNLOADER_JOB_TTL", "3600"))
+    DOWNLOADER_CALLBACK_HOSTS = {
+        host.strip().lower() for host in os.getenv("DOWNLOADER_CALLBACK_HOSTS", "").split(",")
+        if host.strip()
+    }
+
+    # Bounded thread pool used to fan out independent upstream calls.
+    FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+
+    # Threads available to views when served through app.asgi (run.py --asgi).
+    ASGI_WORKER_THREADS = int(os.getenv("ASGI_WORKER_THREADS", "256"))
 
     LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
     RATELIMIT_STORAGE = os.getenv("RATELIMIT_STORAGE", "memory://")
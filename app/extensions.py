@@ -5,6 +5,7 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from .config import Config
+from .utils.http import HTTPClient
 
 
 limiter = Limiter(
@@ -12,3 +13,5 @@ limiter = Limiter(
     default_limits=[],
     storage_uri=Config.RATELIMIT_STORAGE,
 )
+
+http_client = HTTPClient()
@@ -1,15 +1,17 @@
 """AI related routes."""
 from __future__ import annotations
 
-import asyncio
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Any
 
 from flask import Blueprint, current_app, jsonify, request
-from PyCharacterAI import Client
 
-from app.services.gpt import gpt_input
+from app.services.character_ai import conversation_key, get_session
+from app.services.gpt import gpt_input, inference_stats, stream_completion
 from app.utils.auth import require_api_key
+from app.utils.concurrency import ExecutorSaturated
 from app.utils.errors import error_response
+from app.utils.streaming import sse_response, stream_text, wants_stream
 
 
 ai_bp = Blueprint("ai", __name__)
@@ -27,12 +29,14 @@ def ai_floppa() -> tuple[Any, int]:
     if not message:
         return error_response(400)
 
+    conversation = conversation_key(request.args.get("number"))
+    timeout = current_app.config["CHARACTER_AI_TIMEOUT"]
+    if wants_stream():
+        chunks = get_session().stream_message(message, conversation, timeout=timeout)
+        return sse_response(stream_text(chunks))
+
     try:
-        client = Client()
-        asyncio.run(client.authenticate_with_token(current_app.config["CHARACTER_AI_TOKEN"]))
-        chat = asyncio.run(client.create_or_continue_chat(current_app.config["CHARACTER_ID"]))
-        response = asyncio.run(chat.send_message(message))
-        text = response.text
+        text = get_session().send_message(message, conversation=conversation, timeout=timeout)
         return jsonify({"text": text}), 200
     except Exception:  # pragma: no cover - external service
         return error_response(408)
@@ -44,6 +48,25 @@ def ai_gpt4() -> tuple[Any, int]:
     message = _required_arg("input")
     if not message:
         return error_response(400)
-    return jsonify({"text": gpt_input(message, "text")}), 200
+    if wants_stream():
+        try:
+            chunks = stream_completion(message, "text")
+        except ExecutorSaturated:
+            return error_response(503)
+        return sse_response(stream_text(chunks))
+
+    try:
+        text = gpt_input(message, "text")
+    except ExecutorSaturated:
+        return error_response(503)
+    except FutureTimeoutError:
+        return error_response(408)
+    return jsonify({"text": text}), 200
+
+
+@ai_bp.get("/ai/stats")
+@require_api_key
+def ai_stats() -> tuple[Any, int]:
+    return jsonify({"gpt4": inference_stats()}), 200
 
 
@@ -40,7 +40,7 @@ def api_docs() -> tuple[Any, int]:
         "alerts.free_games": {
             "path": "/alert/games",
             "method": "GET",
-            "description": "Lista jogos grátis disponíveis (rate limit: 1 por 4 minutos)",
+            "description": "Lista jogos grátis disponíveis (feed atualizado em segundo plano)",
             "required_params": ["apikey"],
             "optional_params": [],
             "example": f"{base_url}/alert/games?apikey=SUA_API_KEY",
@@ -51,7 +51,7 @@ def api_docs() -> tuple[Any, int]:
             "method": "GET",
             "description": "Baixa conteúdo de redes sociais",
             "required_params": ["apikey", "input"],
-            "optional_params": [],
+            "optional_params": ["nocache", "async", "callback"],
             "example": f"{base_url}/downloader/geral?apikey=SUA_API_KEY&input=https://www.youtube.com/watch?v=VIDEO_ID",
         },
         "downloads.serve_temp_image": {
@@ -116,9 +116,49 @@ def api_docs() -> tuple[Any, int]:
             "method": "GET",
             "description": "Obtém música recente do usuário",
             "required_params": ["apikey"],
-            "optional_params": ["number", "user"],
+            "optional_params": ["number", "user", "nocache"],
             "example": f"{base_url}/fm/recent?apikey=SUA_API_KEY&number=5511999999999",
         },
+        "lastfm.group_recent": {
+            "path": "/fm/group/recent",
+            "method": "GET",
+            "description": "Músicas recentes de vários números de uma vez",
+            "required_params": ["apikey", "numbers"],
+            "optional_params": ["stream", "nocache"],
+            "example": f"{base_url}/fm/group/recent?apikey=SUA_API_KEY&numbers=5511999999999,5511888888888",
+        },
+        "lastfm.nowplaying_stream": {
+            "path": "/fm/nowplaying/stream",
+            "method": "GET",
+            "description": "Stream (SSE) das mudanças de música dos usuários registrados",
+            "required_params": ["apikey"],
+            "optional_params": ["numbers", "last_id"],
+            "example": f"{base_url}/fm/nowplaying/stream?apikey=SUA_API_KEY",
+        },
+        "lastfm.stats": {
+            "path": "/fm/stats",
+            "method": "GET",
+            "description": "Estatísticas do cache de respostas do Last.fm",
+            "required_params": ["apikey"],
+            "optional_params": [],
+            "example": f"{base_url}/fm/stats?apikey=SUA_API_KEY",
+        },
+        "downloads.download_job": {
+            "path": "/downloader/jobs/<job_id>",
+            "method": "GET",
+            "description": "Consulta o status de um download assíncrono (async=1)",
+            "required_params": ["apikey"],
+            "optional_params": [],
+            "example": f"{base_url}/downloader/jobs/JOB_ID?apikey=SUA_API_KEY",
+        },
+        "downloads.stats": {
+            "path": "/downloader/stats",
+            "method": "GET",
+            "description": "Estatísticas do cache de links do downloader",
+            "required_params": ["apikey"],
+            "optional_params": [],
+            "example": f"{base_url}/downloader/stats?apikey=SUA_API_KEY",
+        },
     }
     
     # Coleta todas as rotas do Flask
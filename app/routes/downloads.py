@@ -1,12 +1,13 @@
 """Downloader related routes."""
 from __future__ import annotations
 
-from pathlib import Path
-
 import requests
-from flask import Blueprint, abort, jsonify, request, send_file
+from flask import Blueprint, abort, current_app, jsonify, request, send_from_directory, url_for
 
+from app.services import downloader
+from app.services.image_cache import CACHED_NAME, get_image_cache
 from app.utils.auth import require_api_key
+from app.utils.concurrency import ExecutorSaturated
 from app.utils.errors import error_response
 
 
@@ -20,28 +21,62 @@ def download_general():
     if not target_url:
         return error_response(400)
 
-    headers = {
-        "x-rapidapi-key": "8e941c6787mshba06793555144d9p16fa99jsn7fb15baa1a2e",
-        "x-rapidapi-host": "full-downloader-social-media.p.rapidapi.com",
-    }
+    use_cache = request.args.get("nocache", "").lower() not in {"1", "true", "yes"}
+    if request.args.get("async", "").lower() in {"1", "true", "yes"}:
+        return _submit_job(target_url, use_cache)
 
     try:
-        response = requests.get(
-            "https://full-downloader-social-media.p.rapidapi.com/",
-            headers=headers,
-            params={"url": target_url},
-            timeout=30,
-        )
-        response.raise_for_status()
-        download_url = response.json().get("download_url")
+        download_url = downloader.resolve_download(target_url, use_cache=use_cache)
         return jsonify({"text": download_url}), 200
     except requests.RequestException as exc:  # pragma: no cover - network errors
         return jsonify({"error": "download_failed", "error_desc": str(exc)}), 502
 
 
+def _submit_job(target_url: str, use_cache: bool):
+    callback_url = request.args.get("callback")
+    if callback_url and not downloader.callback_allowed(callback_url):
+        return error_response(400)
+
+    try:
+        job = downloader.submit_job(target_url, callback_url=callback_url, use_cache=use_cache)
+    except ExecutorSaturated:
+        return error_response(503)
+
+    status_url = url_for("downloads.download_job", job_id=job["id"], _external=True)
+    return jsonify({"job_id": job["id"], "status": job["status"], "status_url": status_url}), 202
+
+
+@downloads_bp.get("/downloader/jobs/<job_id>")
+@require_api_key
+def download_job(job_id: str):
+    job = downloader.get_job(job_id)
+    if job is None:
+        return error_response(404)
+    return jsonify(job), 200
+
+
+@downloads_bp.get("/downloader/stats")
+@require_api_key
+def stats():
+    return jsonify(downloader.cache_stats()), 200
+
+
 @downloads_bp.get("/temp_image/<path:filename>")
 def serve_temp_image(filename: str):
-    temp_path = Path("temp_image") / filename
-    if not temp_path.exists():
+    # Cached files are named after their content hash, so the name doubles as
+    # the ETag and clients may keep them for as long as they like.
+    if not CACHED_NAME.match(filename):
         abort(404)
-    return send_file(temp_path, mimetype="image/png")
+    cache = get_image_cache()
+    response = send_from_directory(
+        cache.directory,
+        filename,
+        conditional=True,
+        etag=filename.rsplit(".", 1)[0],
+        max_age=current_app.config["IMAGE_CACHE_MAX_AGE"],
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    # Refresh the LRU position only for files that were actually served.
+    cache.touch(filename)
+    return response
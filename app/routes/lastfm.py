@@ -1,14 +1,27 @@
 """Routes for interacting with Last.fm."""
 from __future__ import annotations
 
-from typing import Any
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, as_completed
+from functools import partial
+from typing import Any, Iterator
 
 import requests
-from flask import Blueprint, jsonify, request
-
-from app.services import lastfm
+from flask import (
+    Blueprint,
+    copy_current_request_context,
+    current_app,
+    jsonify,
+    request,
+    url_for,
+)
+
+from app.services import lastfm, nowplaying, scrobbles
+from app.services.image_cache import get_image_cache
 from app.utils.auth import require_api_key
+from app.utils.concurrency import gather, get_executor
 from app.utils.errors import error_response
+from app.utils.streaming import sse_event, sse_response, wants_stream
 
 
 lastfm_bp = Blueprint("lastfm", __name__, url_prefix="/fm")
@@ -18,6 +31,32 @@ def _username_from_number(number: str | None) -> str | None:
     return lastfm.lookup_user(number) if number else None
 
 
+def _use_cache() -> bool:
+    """Clients can send ``nocache=1`` to force a fresh upstream read."""
+    return request.args.get("nocache", "").lower() not in {"1", "true", "yes"}
+
+
+def _image_url(track: dict[str, Any]) -> str:
+    """Largest artwork of ``track``, served from the local image cache when enabled."""
+    image_url = (track.get("image") or [{}])[-1].get("#text", "")
+    if not image_url or not current_app.config["IMAGE_CACHE_ENABLED"]:
+        return image_url
+    try:
+        filename = get_image_cache().fetch(image_url)
+    except (requests.RequestException, ValueError) as exc:  # pragma: no cover - network errors
+        current_app.logger.warning("Unable to cache %s: %s", image_url, exc)
+        return image_url
+    return url_for("downloads.serve_temp_image", filename=filename, _external=True)
+
+
+def _list_response(payload: list[dict[str, Any]], stale: bool) -> tuple[Any, int]:
+    """Lists keep their JSON shape; stale data is flagged in ``X-Data-Stale``."""
+    response = jsonify(payload)
+    if stale:
+        response.headers["X-Data-Stale"] = "1"
+    return response, 200
+
+
 def _resolve_username() -> tuple[str | None, tuple[Any, int] | None]:
     number = request.args.get("number")
     username = _username_from_number(number)
@@ -56,24 +95,34 @@ def album() -> tuple[Any, int]:
         return error_response(404)
 
     try:
-        recent = lastfm.get_recent_track(username)
+        if scrobbles.has_counts(username):
+            recent, top_albums = lastfm.get_recent_track(username, use_cache=_use_cache()), None
+        else:
+            # The top list does not depend on the recent track, so fetch both at once.
+            recent, top_albums = gather(
+                partial(lastfm.get_recent_track, username, use_cache=_use_cache()),
+                partial(lastfm.get_top_albums, username, use_cache=_use_cache()),
+            )
         if not recent:
             return error_response(404)
 
         album_name = recent.get("album", {}).get("#text")
-        top_albums = lastfm.get_top_albums(username)
-        playcount = next(
-            (item.get("playcount") for item in top_albums if item.get("name") == album_name),
-            "0",
-        )
-        image_url = (recent.get("image") or [{}])[-1].get("#text", "")
+        if top_albums is None:
+            artist_name = recent.get("artist", {}).get("#text")
+            playcount = scrobbles.local_playcount("album", username, artist_name, album_name)
+        else:
+            playcount = next(
+                (item.get("playcount") for item in top_albums if item.get("name") == album_name),
+                "0",
+            )
+        image_url = _image_url(recent)
         payload = {
             "album": album_name,
             "playcount": playcount,
             "image_url": image_url,
         }
         return jsonify(payload), 200
-    except requests.RequestException:  # pragma: no cover - network errors
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover - network errors
         return error_response(404)
 
 
@@ -89,8 +138,8 @@ def top_albums() -> tuple[Any, int]:
         return error_response(404)
 
     try:
-        albums = lastfm.get_top_albums(username)
-    except requests.RequestException:  # pragma: no cover
+        albums, stale = lastfm.get_top_list("albums", username, use_cache=_use_cache())
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover
         return error_response(404)
 
     payload = []
@@ -104,7 +153,7 @@ def top_albums() -> tuple[Any, int]:
                 "playcount": album.get("playcount"),
             }
         )
-    return jsonify(payload), 200
+    return _list_response(payload, stale)
 
 
 @lastfm_bp.get("/top/track")
@@ -119,8 +168,8 @@ def top_tracks() -> tuple[Any, int]:
         return error_response(404)
 
     try:
-        tracks = lastfm.get_top_tracks(username)
-    except requests.RequestException:  # pragma: no cover
+        tracks, stale = lastfm.get_top_list("tracks", username, use_cache=_use_cache())
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover
         return error_response(404)
 
     payload = []
@@ -133,7 +182,7 @@ def top_tracks() -> tuple[Any, int]:
                 "playcount": track.get("playcount"),
             }
         )
-    return jsonify(payload), 200
+    return _list_response(payload, stale)
 
 
 @lastfm_bp.get("/top/artist")
@@ -148,8 +197,8 @@ def top_artists() -> tuple[Any, int]:
         return error_response(404)
 
     try:
-        artists = lastfm.get_top_artists(username)
-    except requests.RequestException:  # pragma: no cover
+        artists, stale = lastfm.get_top_list("artists", username, use_cache=_use_cache())
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover
         return error_response(404)
 
     payload = []
@@ -161,7 +210,7 @@ def top_artists() -> tuple[Any, int]:
                 "playcount": artist.get("playcount"),
             }
         )
-    return jsonify(payload), 200
+    return _list_response(payload, stale)
 
 
 @lastfm_bp.get("/artist")
@@ -176,23 +225,31 @@ def artist() -> tuple[Any, int]:
         return error_response(404)
 
     try:
-        recent = lastfm.get_recent_track(username)
+        if scrobbles.has_counts(username):
+            recent, artists = lastfm.get_recent_track(username, use_cache=_use_cache()), None
+        else:
+            recent, artists = gather(
+                partial(lastfm.get_recent_track, username, use_cache=_use_cache()),
+                partial(lastfm.get_top_artists, username, use_cache=_use_cache()),
+            )
         if not recent:
             return error_response(404)
         artist_name = recent.get("artist", {}).get("#text")
-        artists = lastfm.get_top_artists(username)
-        playcount = next(
-            (item.get("playcount") for item in artists if item.get("name") == artist_name),
-            "0",
-        )
-        image_url = (recent.get("image") or [{}])[-1].get("#text", "")
+        if artists is None:
+            playcount = scrobbles.local_playcount("artist", username, artist_name)
+        else:
+            playcount = next(
+                (item.get("playcount") for item in artists if item.get("name") == artist_name),
+                "0",
+            )
+        image_url = _image_url(recent)
         payload = {
             "artist": artist_name,
             "playcount": playcount,
             "image_url": image_url,
         }
         return jsonify(payload), 200
-    except requests.RequestException:  # pragma: no cover
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover
         return error_response(404)
 
 
@@ -204,27 +261,177 @@ def recent() -> tuple[Any, int]:
         return error
 
     try:
-        track = lastfm.get_recent_track(username)
-        if not track:
-            return error_response(404)
+        payload = _recent_payload(username, _use_cache())
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover
+        return error_response(500)
+    if payload is None:
+        return error_response(404)
+    return jsonify(payload), 200
 
-        track_name = track.get("name")
-        artist_name = track.get("artist", {}).get("#text")
-        album_name = track.get("album", {}).get("#text")
-        now_playing = track.get("@attr", {}).get("nowplaying", "false") == "true"
-        image_url = (track.get("image") or [{}])[-1].get("#text", "")
 
-        track_info = lastfm.get_track_info(username, artist_name, track_name)
+def _recent_payload(
+    username: str, use_cache: bool, priority: int = lastfm.INTERACTIVE
+) -> dict[str, Any] | None:
+    track = lastfm.get_recent_track(username, use_cache=use_cache, priority=priority)
+    if not track:
+        return None
+
+    track_name = track.get("name")
+    artist_name = track.get("artist", {}).get("#text")
+    playcount = scrobbles.local_playcount("track", username, artist_name, track_name)
+    if playcount is None:
+        track_info = lastfm.get_track_info(
+            username, artist_name, track_name, use_cache=use_cache, priority=priority
+        )
         playcount = track_info.get("userplaycount", "0")
+    return {
+        "track_name": track_name,
+        "artist": artist_name,
+        "album": track.get("album", {}).get("#text"),
+        "playcount": playcount,
+        "now_playing": track.get("@attr", {}).get("nowplaying", "false") == "true",
+        "image_url": _image_url(track),
+    }
 
-        payload = {
-            "track_name": track_name,
-            "artist": artist_name,
-            "album": album_name,
-            "playcount": playcount,
-            "now_playing": now_playing,
-            "image_url": image_url,
-        }
-        return jsonify(payload), 200
-    except requests.RequestException:  # pragma: no cover
-        return error_response(500)
+
+@lastfm_bp.route("/group/recent", methods=["GET", "POST"])
+@require_api_key
+def group_recent():
+    """Recent tracks for many numbers at once (``numbers=a,b,c`` or a JSON body).
+
+    Members are fetched concurrently on their own bounded pool. Each result
+    carries the member's ``number`` and a ``status``; with ``stream=1`` they
+    are sent as SSE events in completion order, otherwise as one list in
+    request order once all are done or ``LASTFM_GROUP_TIMEOUT`` passes.
+    """
+    numbers = _group_numbers()
+    if not numbers:
+        return error_response(400)
+    if len(numbers) > current_app.config["LASTFM_GROUP_MAX_NUMBERS"]:
+        return error_response(413)
+
+    usernames = lastfm.lookup_users(numbers)
+    use_cache = _use_cache()
+    executor = get_executor("lastfm-group", current_app.config["LASTFM_GROUP_WORKERS"])
+    futures = {
+        executor.submit(
+            copy_current_request_context(partial(_group_member, number, username, use_cache))
+        ): number
+        for number, username in usernames.items()
+    }
+    missing = [{"number": number, "status": 404} for number in numbers if number not in usernames]
+    timeout = current_app.config["LASTFM_GROUP_TIMEOUT"]
+
+    if wants_stream():
+        return sse_response(_stream_group(futures, missing, timeout))
+
+    results = {item["number"]: item for item in missing}
+    for item in _completed(futures, timeout):
+        results[item["number"]] = item
+    return jsonify([results[number] for number in numbers]), 200
+
+
+def _group_numbers() -> list[str] | None:
+    """Numbers from ``?numbers=`` or a JSON body; ``None`` if the body is malformed.
+
+    The body's ``numbers`` may be a list or a comma-separated string.
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        raw = body.get("numbers") if isinstance(body, dict) else None
+        if isinstance(raw, str):
+            raw = raw.split(",")
+        if not isinstance(raw, list) or not all(
+            isinstance(number, (str, int)) and not isinstance(number, bool) for number in raw
+        ):
+            return None
+    else:
+        raw = [part for value in request.args.getlist("numbers") for part in value.split(",")]
+    numbers = [str(number).strip().replace("@s.whatsapp.net", "") for number in raw]
+    return list(dict.fromkeys(number for number in numbers if number))
+
+
+def _group_member(number: str, username: str, use_cache: bool) -> dict[str, Any]:
+    try:
+        # A group of 200 must not starve individual commands of rate budget.
+        payload = _recent_payload(username, use_cache, priority=lastfm.BULK)
+    except (requests.RequestException, lastfm.LastFMError):  # pragma: no cover - network errors
+        return {"number": number, "user": username, "status": 502}
+    if payload is None:
+        return {"number": number, "user": username, "status": 404}
+    return {"number": number, "user": username, "status": 200, **payload}
+
+
+def _completed(futures: dict[Future, str], timeout: float) -> Iterator[dict[str, Any]]:
+    """Yield member results as they finish, then a 408 for whoever ran out of time."""
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            yield future.result()
+    except FutureTimeoutError:
+        pass
+    finally:
+        for future in pending:
+            future.cancel()
+    for future in pending:
+        yield {"number": futures[future], "status": 408}
+
+
+def _stream_group(
+    futures: dict[Future, str], missing: list[dict[str, Any]], timeout: float
+) -> Iterator[str]:
+    for item in missing:
+        yield sse_event(item)
+    for item in _completed(futures, timeout):
+        yield sse_event(item)
+    yield sse_event({"count": len(futures) + len(missing)}, event="done")
+
+
+@lastfm_bp.get("/nowplaying/stream")
+@require_api_key
+def nowplaying_stream():
+    """SSE feed of now-playing changes found by the background watcher.
+
+    ``numbers`` restricts the feed to those members; reconnecting clients
+    resume after ``Last-Event-ID`` (or ``last_id``).
+    """
+    if not current_app.config["NOWPLAYING_WATCH_ENABLED"]:
+        return error_response(404)
+
+    numbers = set(_group_numbers())
+    events = nowplaying.get_event_log()
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    last_id = int(last_id) if last_id and last_id.isdigit() else events.last_id()
+    return sse_response(_stream_nowplaying(events, numbers, last_id))
+
+
+def _stream_nowplaying(
+    events: nowplaying.EventLog, numbers: set[str], last_id: int
+) -> Iterator[str]:
+    idle_since = time.monotonic()
+    while True:
+        for event in events.since(last_id):
+            last_id = event["id"]
+            if numbers and numbers.isdisjoint(event.get("numbers", [])):
+                continue
+            idle_since = time.monotonic()
+            yield f"id: {last_id}\n" + sse_event(event)
+        if time.monotonic() - idle_since >= 15:
+            # Comment frames keep proxies from closing an idle stream.
+            idle_since = time.monotonic()
+            yield ": keepalive\n\n"
+        time.sleep(1.0)
+
+
+@lastfm_bp.get("/stats")
+@require_api_key
+def stats() -> tuple[Any, int]:
+    payload = {
+        "cache": lastfm.cache_stats(),
+        "single_flight": lastfm.flight_stats(),
+        "rate_limit": lastfm.rate_limit_stats(),
+        "stale": lastfm.stale_stats(),
+        "nowplaying": nowplaying.watcher_stats(),
+    }
+    return jsonify(payload), 200
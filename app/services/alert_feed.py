@@ -0,0 +1,198 @@
+"""Precomputed feed of free-game alerts, refreshed in the background."""
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+import requests
+from flask import Flask, current_app
+
+from app.services.freestuff import SeenGames, fetch_free_game_ids, fetch_game_details
+from app.services.thumbnails import host_thumbnail
+from app.utils.concurrency import get_executor, submit_with_app_context
+from app.utils.scheduler import PeriodicTask
+from app.utils.storage import atomic_write_text, file_signature, try_file_lock
+from app.utils.time import formatted_brazil_time
+
+
+class GameFeed:
+    """Resolved games stored on disk, newest first, cached until the file changes."""
+
+    def __init__(self, path: Path, max_games: int = 50) -> None:
+        self.path = path
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self.max_games = max_games
+        self._lock = threading.Lock()
+        self._games: list[dict[str, Any]] = []
+        self._signature: tuple[int, int, int] | None = None
+
+    def games(self) -> list[dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return list(self._games)
+
+    def ids(self) -> set[str]:
+        return {str(game.get("id")) for game in self.games()}
+
+    def publish(self, games: list[dict[str, Any]], listed: set[str] | None = None) -> None:
+        """Prepend newly resolved ``games`` and persist the feed atomically.
+
+        With ``listed`` given, games whose id is no longer in it are dropped, so
+        the feed only holds games FreeStuff still lists.
+        """
+        with self._lock:
+            self._refresh()
+            new_ids = {str(game.get("id")) for game in games}
+            merged = games + [
+                game
+                for game in self._games
+                if str(game.get("id")) not in new_ids
+                and (listed is None or str(game.get("id")) in listed)
+            ]
+            self._games = merged[: self.max_games]
+            payload = {"updated_at": formatted_brazil_time(), "games": self._games}
+            atomic_write_text(self.path, json.dumps(payload, ensure_ascii=False))
+            self._signature = file_signature(self.path)
+
+    def _refresh(self) -> None:
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf8") or "{}")
+        except (FileNotFoundError, json.JSONDecodeError):
+            payload = {}
+        self._games = payload.get("games", []) if isinstance(payload, dict) else []
+
+
+_feeds: dict[str, GameFeed] = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed() -> GameFeed:
+    location = current_app.config["ALERT_FEED_FILE"]
+    with _feeds_lock:
+        feed = _feeds.get(location)
+        if feed is None:
+            feed = _feeds[location] = GameFeed(Path(location))
+        return feed
+
+
+def get_seen_games() -> SeenGames:
+    config = current_app.config
+    return SeenGames(
+        Path(config["SEEN_GAMES_FILE"]),
+        ttl=config["SEEN_GAMES_TTL"],
+        max_entries=config["SEEN_GAMES_MAX"],
+        legacy_path=Path(config["LAST_GAME_ID_FILE"]),
+    )
+
+
+def claim_unseen_games() -> list[dict[str, Any]]:
+    """Return feed games that were never announced, in feed order, marking them seen."""
+    games = get_feed().games()
+    fresh = set(get_seen_games().claim(game.get("id") for game in games))
+    return [game for game in games if str(game.get("id")) in fresh]
+
+
+def resolve_game(game_id: int) -> dict[str, Any] | None:
+    """Fetch a game's details and host its thumbnail, returning the alert payload."""
+    try:
+        details = fetch_game_details(game_id)
+    except requests.HTTPError as exc:  # pragma: no cover
+        current_app.logger.warning("Failed to fetch game %s info: %s", game_id, exc)
+        return None
+
+    if not details or details.get("id") is None:
+        return None
+
+    thumbnail_url = details.get("thumbnail", {}).get("org")
+    image_url = None
+    if thumbnail_url:
+        try:
+            image_url = host_thumbnail(thumbnail_url)
+        except (requests.RequestException, ValueError) as exc:  # pragma: no cover
+            current_app.logger.warning("Unable to upload thumbnail: %s", exc)
+
+    return {
+        "id": details.get("id"),
+        "nome": details.get("title"),
+        "descri": details.get("description"),
+        "linkd": details.get("urls", {}).get("browser"),
+        "termino": details.get("localized", {}).get("pt-BR", {}).get("until"),
+        "brl": details.get("org_price", {}).get("brl"),
+        "tumbnail": image_url,
+    }
+
+
+def refresh_feed() -> None:
+    """Poll FreeStuff and publish every game that is not in the feed yet.
+
+    New games are resolved concurrently and published together, in the order
+    FreeStuff lists them, with one atomic write. Games that fail to resolve
+    are left out and retried on the next poll. Games FreeStuff no longer lists
+    are dropped, so none outlives its seen entry and gets announced again.
+
+    Raises :class:`requests.HTTPError` when the game list cannot be fetched.
+    """
+    feed = get_feed()
+    known = feed.ids()
+    listed_ids = fetch_free_game_ids()
+    listed = {str(game_id) for game_id in listed_ids}
+    new_ids = [game_id for game_id in listed_ids if str(game_id) not in known]
+    if not new_ids:
+        if known - listed:
+            feed.publish([], listed)
+        return
+
+    executor = get_executor(
+        "freestuff", max_workers=current_app.config["FREESTUFF_RESOLVE_WORKERS"]
+    )
+    futures = [submit_with_app_context(executor, resolve_game, game_id) for game_id in new_ids]
+    games = []
+    for game_id, future in zip(new_ids, futures):
+        try:
+            game = future.result()
+        except requests.RequestException as exc:  # pragma: no cover - depends on external API
+            current_app.logger.warning("Failed to resolve game %s: %s", game_id, exc)
+            continue
+        if game:
+            games.append(game)
+    if games or known - listed:
+        feed.publish(games, listed)
+
+
+def _poll() -> None:
+    feed = get_feed()
+    # Only one worker process polls at a time; the others read its feed file.
+    with try_file_lock(feed.lock_path) as acquired:
+        if not acquired:
+            return
+        try:
+            refresh_feed()
+        except requests.RequestException as exc:  # pragma: no cover - depends on external API
+            current_app.logger.warning("Free games poll failed: %s", exc)
+
+
+_poller: PeriodicTask | None = None
+
+
+def start_poller(app: Flask) -> PeriodicTask | None:
+    """Start the background poller once per process when an interval is configured."""
+    global _poller
+    interval = app.config.get("FREESTUFF_POLL_INTERVAL", 0)
+    if interval <= 0 or poller_running():
+        return _poller
+    with _feeds_lock:
+        if _poller is None:
+            _poller = PeriodicTask(app, "free-games-poller", _poll, interval)
+    _poller.start()
+    return _poller
+
+
+def poller_running() -> bool:
+    return _poller is not None and _poller.running
+
@@ -0,0 +1,300 @@
+"""Long-lived Character.AI session shared by the Floppa persona routes."""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Any, Coroutine, Iterator
+
+from flask import current_app
+from PyCharacterAI import get_client
+from PyCharacterAI.exceptions import SessionClosedError
+
+from app.utils.storage import atomic_write_text, file_lock, file_signature
+from app.utils.streaming import ChunkQueue
+
+
+DEFAULT_CONVERSATION = "default"
+
+
+class ChatStore:
+    """Bounded LRU of conversation key → chat id, persisted across restarts.
+
+    Chats idle for longer than ``idle_ttl`` seconds are dropped, so the next
+    message from that user starts a fresh conversation. The mapping is written
+    whenever a chat is added or evicted and otherwise at most every
+    ``persist_interval`` seconds.
+
+    Worker processes share the file: lookups pick up chats other workers
+    wrote, and each write merges the file under a lock (newest use wins)
+    instead of overwriting it with this process's view.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        *,
+        maxsize: int = 1000,
+        idle_ttl: float = 7 * 24 * 3600,
+        persist_interval: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.persist_interval = persist_interval
+        self.lock_path = path.with_name(f"{path.name}.lock") if path is not None else None
+        self._chats: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._discarded: set[str] = set()
+        self._signature: tuple[int, int, int] | None = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_persist = 0.0
+        with self._lock:
+            self._load()
+
+    def get(self, conversation: str) -> str | None:
+        with self._lock:
+            self._load()
+            self._evict_idle()
+            item = self._chats.get(conversation)
+            if item is None:
+                return None
+            self._chats[conversation] = (item[0], time.time())
+            self._chats.move_to_end(conversation)
+            self._dirty = True
+        self._persist()
+        return item[0]
+
+    def set(self, conversation: str, chat_id: str) -> None:
+        with self._lock:
+            self._discarded.discard(conversation)
+            self._chats[conversation] = (chat_id, time.time())
+            self._chats.move_to_end(conversation)
+            while len(self._chats) > self.maxsize:
+                self._chats.popitem(last=False)
+            self._dirty = True
+        self._persist(force=True)
+
+    def discard(self, conversation: str) -> None:
+        # Other workers keep a discarded chat in memory until it idles out.
+        with self._lock:
+            if self._chats.pop(conversation, None) is not None:
+                self._discarded.add(conversation)
+                self._dirty = True
+        self._persist(force=True)
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def _evict_idle(self) -> None:
+        cutoff = time.time() - self.idle_ttl
+        while self._chats:
+            conversation, (_chat_id, last_used) = next(iter(self._chats.items()))
+            if last_used >= cutoff:
+                break
+            del self._chats[conversation]
+            self._dirty = True
+
+    def _load(self) -> None:
+        """Merge the file into memory if another process changed it."""
+        if self.path is None:
+            return
+        signature = file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return
+        self._signature = signature
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf8") or "[]")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for item in raw:
+            conversation, chat_id = item.get("conversation"), item.get("chat_id")
+            if not conversation or not chat_id or conversation in self._discarded:
+                continue
+            current = self._chats.get(conversation)
+            if current is None or current[1] < item.get("last_used", 0):
+                self._chats[conversation] = (chat_id, item.get("last_used", 0))
+        self._chats = OrderedDict(sorted(self._chats.items(), key=lambda item: item[1][1]))
+        while len(self._chats) > self.maxsize:
+            self._chats.popitem(last=False)
+        self._evict_idle()
+
+    def _persist(self, force: bool = False) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty or (not force and now - self._last_persist < self.persist_interval):
+                return
+            with file_lock(self.lock_path):
+                self._load()
+                payload = [
+                    {"conversation": conversation, "chat_id": chat_id, "last_used": last_used}
+                    for conversation, (chat_id, last_used) in self._chats.items()
+                ]
+                atomic_write_text(self.path, json.dumps(payload, ensure_ascii=False))
+                self._signature = file_signature(self.path)
+            self._dirty = False
+            self._discarded.clear()
+            self._last_persist = now
+
+
+class CharacterAISession:
+    """Authenticated Character.AI client driven by a background event loop.
+
+    The client authenticates once and keeps one chat handle per conversation
+    key. Request threads hand coroutines to the loop and block on the result,
+    so no request ever creates its own event loop. If the websocket session is
+    closed underneath us the client is rebuilt and the message retried once.
+    """
+
+    def __init__(self, token: str, character_id: str, chats: ChatStore | None = None) -> None:
+        self.token = token
+        self.character_id = character_id
+        self.chats = chats if chats is not None else ChatStore()
+        self._client: Any = None
+        self._conversation_locks: dict[str, asyncio.Lock] = {}
+        self._loop = asyncio.new_event_loop()
+        self._client_lock = asyncio.Lock()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="character-ai", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: float | None = None) -> Any:
+        """Run ``coro`` on the session loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def send_message(
+        self, text: str, conversation: str = DEFAULT_CONVERSATION, timeout: float | None = None
+    ) -> str:
+        future = self.submit(self._send_message(text, conversation))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def stream_message(
+        self, text: str, conversation: str = DEFAULT_CONVERSATION, timeout: float | None = None
+    ) -> Iterator[str]:
+        """Yield the reply as it is generated, one new text segment at a time."""
+        chunks = ChunkQueue()
+        self.submit(self._stream_message(text, conversation, chunks))
+        return chunks.iterate(timeout)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self.run(self._reset_client(), timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _send_message(self, text: str, conversation: str) -> str:
+        # Messages to the same chat are serialised; different users proceed
+        # concurrently on the shared websocket session.
+        async with self._conversation_lock(conversation):
+            for attempt in range(2):
+                client = await self._get_client()
+                try:
+                    chat_id = await self._chat_id(client, conversation)
+                    turn = await client.chat.send_message(self.character_id, chat_id, text)
+                    return turn.get_primary_candidate().text
+                except SessionClosedError:
+                    if attempt:
+                        raise
+                    await self._reset_client(client)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def _stream_message(self, text: str, conversation: str, chunks: ChunkQueue) -> None:
+        try:
+            async with self._conversation_lock(conversation):
+                client = await self._get_client()
+                chat_id = await self._chat_id(client, conversation)
+                sent = ""
+                stream = await client.chat.send_message(
+                    self.character_id, chat_id, text, streaming=True
+                )
+                async for turn in stream:
+                    # Each turn carries the whole candidate so far; emit the delta.
+                    current = turn.get_primary_candidate().text or ""
+                    if current.startswith(sent) and len(current) > len(sent):
+                        chunks.put(current[len(sent):])
+                        sent = current
+        except SessionClosedError as exc:
+            await self._reset_client()
+            chunks.close(exc)
+            return
+        except Exception as exc:  # pragma: no cover - external service
+            chunks.close(exc)
+            return
+        chunks.close()
+
+    def _conversation_lock(self, conversation: str) -> asyncio.Lock:
+        lock = self._conversation_locks.get(conversation)
+        if lock is None:
+            if len(self._conversation_locks) > 2 * self.chats.maxsize:
+                # Drop locks nobody is waiting on so the dict stays bounded.
+                self._conversation_locks = {
+                    key: value for key, value in self._conversation_locks.items() if value.locked()
+                }
+            lock = self._conversation_locks[conversation] = asyncio.Lock()
+        return lock
+
+    async def _get_client(self) -> Any:
+        async with self._client_lock:
+            if self._client is None:
+                self._client = await get_client(token=self.token)
+            return self._client
+
+    async def _reset_client(self, stale: Any = None) -> None:
+        async with self._client_lock:
+            # Another request may already have reconnected.
+            if self._client is None or (stale is not None and self._client is not stale):
+                return
+            client, self._client = self._client, None
+        try:
+            await client.close_session()
+        except Exception:  # pragma: no cover - best effort cleanup
+            pass
+
+    async def _chat_id(self, client: Any, conversation: str) -> str:
+        # The store locks and fsyncs its file; keep that off the event loop.
+        chat_id = await asyncio.to_thread(self.chats.get, conversation)
+        if chat_id is None:
+            chat, _greeting = await client.chat.create_chat(self.character_id, greeting=False)
+            chat_id = chat.chat_id
+            await asyncio.to_thread(self.chats.set, conversation, chat_id)
+        return chat_id
+
+
+_sessions: dict[tuple[str, str], CharacterAISession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session() -> CharacterAISession:
+    """Return the process-wide session for the configured token and character."""
+    config = current_app.config
+    key = (config["CHARACTER_AI_TOKEN"], config["CHARACTER_ID"])
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            chats = ChatStore(
+                Path(config["CHARACTER_AI_CHATS_FILE"]),
+                maxsize=config["CHARACTER_AI_MAX_CHATS"],
+                idle_ttl=config["CHARACTER_AI_CHAT_IDLE_TTL"],
+            )
+            session = _sessions[key] = CharacterAISession(*key, chats=chats)
+        return session
+
+
+def conversation_key(number: str | None) -> str:
+    """Map a WhatsApp user or group JID to the key of its Floppa chat."""
+    if not number:
+        return DEFAULT_CONVERSATION
+    return number.strip().replace("@s.whatsapp.net", "")
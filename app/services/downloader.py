@@ -0,0 +1,235 @@
+"""Resolve social media links to direct download URLs through RapidAPI."""
+from __future__ import annotations
+
+import secrets
+import threading
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from flask import current_app
+
+from app.extensions import http_client
+from app.utils.cache import MISSING, DiskCache, TTLCache
+from app.utils.concurrency import BoundedExecutor, ExecutorSaturated
+from app.utils.singleflight import SingleFlight
+from app.utils.time import formatted_brazil_time
+
+
+RAPIDAPI_URL = "https://full-downloader-social-media.p.rapidapi.com/"
+
+# Query parameters that only identify who shared a link, never what it points to.
+TRACKING_PARAMS = {"fbclid", "gclid", "igsh", "igshid", "si", "feature", "ref", "ref_src", "s", "t"}
+TRACKING_PREFIXES = ("utm_", "_r", "share_")
+
+HOST_ALIASES = {
+    "m.youtube.com": "www.youtube.com",
+    "youtube.com": "www.youtube.com",
+    "music.youtube.com": "www.youtube.com",
+    "mobile.twitter.com": "x.com",
+    "twitter.com": "x.com",
+    "www.twitter.com": "x.com",
+    "www.x.com": "x.com",
+    "instagram.com": "www.instagram.com",
+    "m.facebook.com": "www.facebook.com",
+    "facebook.com": "www.facebook.com",
+    "tiktok.com": "www.tiktok.com",
+    "m.tiktok.com": "www.tiktok.com",
+}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalise ``url`` so that every way of sharing a post maps to one key.
+
+    Scheme and host are lower-cased and aliased, fragments and tracking
+    parameters dropped and the remaining parameters sorted. YouTube short
+    links (``youtu.be/<id>``, ``/shorts/<id>``) become ``/watch?v=<id>``.
+    Shorteners that need an HTTP redirect to resolve (``vm.tiktok.com``) are
+    kept as they are.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    host = HOST_ALIASES.get(host, host)
+    path = parts.path.rstrip("/") or "/"
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+
+    if host == "youtu.be" and path != "/":
+        host, query = "www.youtube.com", [("v", path.lstrip("/"))] + query
+        path = "/watch"
+    elif host == "www.youtube.com" and path.startswith("/shorts/"):
+        query = [("v", path[len("/shorts/"):])] + query
+        path = "/watch"
+    if host == "www.youtube.com" and path == "/watch":
+        # Only the video id matters; playlists, timestamps etc. do not change the file.
+        query = [(key, value) for key, value in query if key == "v"]
+
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+_results: TTLCache | None = None
+_results_lock = threading.Lock()
+_flights = SingleFlight()
+
+
+def _get_results() -> TTLCache:
+    global _results
+    if _results is None:
+        with _results_lock:
+            if _results is None:
+                _results = TTLCache(
+                    maxsize=current_app.config["DOWNLOADER_CACHE_SIZE"],
+                    ttl=current_app.config["DOWNLOADER_CACHE_TTL"],
+                )
+    return _results
+
+
+def resolve_download(url: str, *, use_cache: bool = True) -> str | None:
+    """Return the direct download URL for the media behind ``url``.
+
+    Results are cached by canonical URL, and concurrent requests for the same
+    link share a single RapidAPI call. Empty answers are not cached.
+
+    Raises :class:`requests.RequestException` when RapidAPI fails.
+    """
+    canonical = canonicalize_url(url)
+    results = _get_results()
+    if use_cache:
+        cached = results.get(canonical)
+        if cached is not MISSING:
+            return cached
+
+    def fetch() -> str | None:
+        download_url = _fetch_download_url(canonical)
+        if download_url:
+            results.set(canonical, download_url)
+        return download_url
+
+    return _flights.do(canonical, fetch)
+
+
+def _fetch_download_url(url: str) -> str | None:
+    config = current_app.config
+    response = http_client.get(
+        "rapidapi",
+        RAPIDAPI_URL,
+        headers={
+            "x-rapidapi-key": config["RAPIDAPI_KEY"],
+            "x-rapidapi-host": urlsplit(RAPIDAPI_URL).hostname,
+        },
+        params={"url": url},
+    )
+    response.raise_for_status()
+    return response.json().get("download_url")
+
+
+def cache_stats() -> dict[str, Any]:
+    return {
+        "cache": _get_results().stats(),
+        "single_flight": _flights.stats(),
+        "jobs": get_job_executor().stats(),
+    }
+
+
+_executor: BoundedExecutor | None = None
+_jobs: DiskCache | None = None
+
+
+def get_job_executor() -> BoundedExecutor:
+    """Return the bounded worker pool that resolves queued download jobs."""
+    global _executor
+    if _executor is None:
+        with _results_lock:
+            if _executor is None:
+                _executor = BoundedExecutor(
+                    "downloader",
+                    workers=current_app.config["DOWNLOADER_WORKERS"],
+                    queue_size=current_app.config["DOWNLOADER_QUEUE_SIZE"],
+                )
+    return _executor
+
+
+def _get_jobs() -> DiskCache:
+    # Jobs live on disk so any worker process can answer a status poll.
+    global _jobs
+    if _jobs is None:
+        with _results_lock:
+            if _jobs is None:
+                _jobs = DiskCache(
+                    Path(current_app.config["DOWNLOADER_JOBS_DIR"]),
+                    ttl=current_app.config["DOWNLOADER_JOB_TTL"],
+                    max_bytes=16 * 1024**2,
+                )
+    return _jobs
+
+
+def callback_allowed(callback_url: str) -> bool:
+    """Callbacks may only target hosts listed in ``DOWNLOADER_CALLBACK_HOSTS``."""
+    parts = urlsplit(callback_url)
+    allowed = current_app.config["DOWNLOADER_CALLBACK_HOSTS"]
+    return parts.scheme in {"http", "https"} and (parts.hostname or "").lower() in allowed
+
+
+def submit_job(
+    url: str, *, callback_url: str | None = None, use_cache: bool = True
+) -> dict[str, Any]:
+    """Queue ``url`` for resolution and return the new job record.
+
+    Raises :class:`~app.utils.concurrency.ExecutorSaturated` when the worker
+    pool and its queue are full.
+    """
+    now = formatted_brazil_time()
+    job = {
+        "id": secrets.token_hex(16),
+        "status": "queued",
+        "input": url,
+        "text": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    _get_jobs().set(job["id"], job)
+    try:
+        get_job_executor().submit(_run_job, job, callback_url, use_cache)
+    except ExecutorSaturated:
+        _update_job(job, status="failed", error="rejected")
+        raise
+    return job
+
+
+def get_job(job_id: str) -> dict[str, Any] | None:
+    if not job_id.isalnum():
+        return None
+    job = _get_jobs().get(job_id)
+    return None if job is MISSING else job
+
+
+def _run_job(job: dict[str, Any], callback_url: str | None, use_cache: bool) -> None:
+    job = _update_job(job, status="running")
+    try:
+        download_url = resolve_download(job["input"], use_cache=use_cache)
+    except requests.RequestException as exc:  # pragma: no cover - network errors
+        job = _update_job(job, status="failed", error=str(exc))
+    except Exception as exc:
+        # Anything else (e.g. an unexpected response shape) must still settle
+        # the job and reach the callback instead of leaving it "running".
+        current_app.logger.exception("Download job %s failed", job["id"])
+        job = _update_job(job, status="failed", error=str(exc) or type(exc).__name__)
+    else:
+        job = _update_job(job, status="done", text=download_url)
+
+    if callback_url:
+        try:
+            http_client.post("callbacks", callback_url, json=job).raise_for_status()
+        except requests.RequestException as exc:  # pragma: no cover - network errors
+            current_app.logger.warning("Download job %s callback failed: %s", job["id"], exc)
+
+
+def _update_job(job: dict[str, Any], **changes: Any) -> dict[str, Any]:
+    job = {**job, **changes, "updated_at": formatted_brazil_time()}
+    _get_jobs().set(job["id"], job)
+    return job
@@ -1,13 +1,16 @@
 """Helpers for interacting with the FreeStuff API."""
 from __future__ import annotations
 
-import base64
+import json
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
 
-import requests
 from flask import current_app
 
+from app.extensions import http_client
+from app.utils.storage import atomic_write_text, file_lock
+
 
 GAMES_ENDPOINT = "https://api.freestuffbot.xyz/v1/games/free"
 GAME_INFO_ENDPOINT = "https://api.freestuffbot.xyz/v1/game/{game_id}/info"
@@ -23,7 +26,7 @@ def _auth_headers() -> dict[str, str]:
 
 
 def fetch_free_game_ids() -> list[int]:
-    response = requests.get(GAMES_ENDPOINT, headers=_auth_headers(), timeout=30)
+    response = http_client.get("freestuff", GAMES_ENDPOINT, headers=_auth_headers())
     response.raise_for_status()
     payload = response.json()
     return payload.get("data", [])
@@ -32,16 +35,20 @@ def fetch_free_game_ids() -> list[int]:
 def fetch_game_details(game_id: int) -> dict[str, Any]:
     params = {"lang": "pt-BR"}
     url = GAME_INFO_ENDPOINT.format(game_id=game_id)
-    response = requests.get(url, headers=_auth_headers(), params=params, timeout=30)
+    response = http_client.get("freestuff", url, headers=_auth_headers(), params=params)
     response.raise_for_status()
     payload = response.json().get("data", {})
     return payload.get(str(game_id), {})
 
 
 def upload_thumbnail(content: bytes) -> str:
-    encoded = base64.b64encode(content).decode("utf-8")
-    data = {"expiration": 600, "key": current_app.config["IMGBB_API_KEY"], "image": encoded}
-    response = requests.post(IMGBB_ENDPOINT, data=data, timeout=30)
+    # Sent as a multipart file rather than a base64 form field.
+    params = {
+        "expiration": current_app.config["IMGBB_EXPIRATION"],
+        "key": current_app.config["IMGBB_API_KEY"],
+    }
+    files = {"image": ("thumbnail", content)}
+    response = http_client.post("imgbb", IMGBB_ENDPOINT, params=params, files=files)
     response.raise_for_status()
     return response.json()["data"]["url"]
 
@@ -53,5 +60,61 @@ def read_last_game_id(path: Path) -> int | None:
     return int(raw) if raw else None
 
 
-def write_last_game_id(path: Path, game_id: int) -> None:
-    path.write_text(str(game_id))
+class SeenGames:
+    """Bounded, expiring set of announced game ids persisted as JSON.
+
+    :meth:`claim` marks a whole batch in one atomic write under a file lock,
+    so concurrent workers never announce the same game twice and a batch is
+    either fully recorded or not at all.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        ttl: float = 60 * 24 * 3600,
+        max_entries: int = 5000,
+        legacy_path: Path | None = None,
+    ) -> None:
+        self.path = path
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.legacy_path = legacy_path
+
+    def claim(self, game_ids: Iterable[Any]) -> list[str]:
+        """Return the ids of ``game_ids`` not seen before, in order, and mark them seen."""
+        with file_lock(self.lock_path):
+            seen = self._load()
+            fresh = []
+            for game_id in map(str, game_ids):
+                if game_id not in seen and game_id not in fresh:
+                    fresh.append(game_id)
+            if fresh:
+                now = time.time()
+                seen.update({game_id: now for game_id in fresh})
+                self._save(seen)
+            return fresh
+
+    def _load(self) -> dict[str, float]:
+        if not self.path.exists():
+            return self._legacy_seed()
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf8") or "{}")
+        except json.JSONDecodeError:
+            raw = {}
+        cutoff = time.time() - self.ttl
+        return {
+            str(game_id): float(seen_at)
+            for game_id, seen_at in raw.get("seen", {}).items()
+            if float(seen_at) >= cutoff
+        }
+
+    def _save(self, seen: dict[str, float]) -> None:
+        newest = sorted(seen.items(), key=lambda item: item[1])[-self.max_entries :]
+        atomic_write_text(self.path, json.dumps({"seen": dict(newest)}))
+
+    def _legacy_seed(self) -> dict[str, float]:
+        # Carry over the single id tracked by the previous last_game_id.txt scheme.
+        legacy_id = read_last_game_id(self.legacy_path) if self.legacy_path else None
+        return {str(legacy_id): time.time()} if legacy_id is not None else {}
@@ -1,13 +1,146 @@
 """Wrappers around g4f for prompt generation."""
 from __future__ import annotations
 
-from typing import Literal
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Any, Iterator, Literal
 
 import g4f
+from flask import current_app
+
+from app.services.providers import ProviderScheduler
+from app.utils.cache import MISSING, DiskCache, TTLCache
+from app.utils.concurrency import BoundedExecutor
+from app.utils.streaming import ChunkQueue
 
 
 IMAGE_PROMPT_TEMPLATE = """Analyze the given input text, and create a summary.\nThe output text is intended for an image-generation AI and must describe an image that is appropriate to the text.\nThe image style and theme should match the style and genre of the text.\nThe input text is delimited by triple backticks.\nDo not include the sentence \"Generate a charming image\" in the summary.\nEach summary should be 150 words long.\n```{text}```"""
 
+FALLBACK_TEXT = "Nao foi possivel processar"
+MODEL_NAME = "gpt-4-turbo"
+
+_executor: BoundedExecutor | None = None
+_scheduler: ProviderScheduler | None = None
+_memory_cache: TTLCache | None = None
+_disk_cache: DiskCache | None = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> BoundedExecutor:
+    """Return the bounded worker pool that runs g4f completions."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = BoundedExecutor(
+                    "g4f",
+                    workers=current_app.config["GPT_WORKERS"],
+                    queue_size=current_app.config["GPT_QUEUE_SIZE"],
+                )
+    return _executor
+
+
+def get_provider_scheduler() -> ProviderScheduler | None:
+    """Return the provider scheduler, or ``None`` when no providers are known."""
+    global _scheduler
+    if _scheduler is None:
+        with _executor_lock:
+            if _scheduler is None:
+                providers = _configured_providers()
+                if not providers:
+                    return None
+                config = current_app.config
+                _scheduler = ProviderScheduler(
+                    providers,
+                    race=config["GPT_PROVIDER_RACE"],
+                    failure_threshold=config["GPT_PROVIDER_FAILURE_THRESHOLD"],
+                    cooldown=config["GPT_PROVIDER_COOLDOWN"],
+                    max_in_flight=config["GPT_PROVIDER_MAX_IN_FLIGHT"],
+                )
+    return _scheduler
+
+
+def _configured_providers() -> list[Any]:
+    names = current_app.config.get("GPT_PROVIDERS") or []
+    if not names:
+        # Fall back to the candidates g4f would iterate over for the model.
+        best = getattr(_model(), "best_provider", None)
+        return list(getattr(best, "providers", None) or ([best] if best else []))
+
+    providers = []
+    for name in names:
+        provider = getattr(g4f.Provider, name, None)
+        if provider is None:
+            current_app.logger.warning("Unknown g4f provider %s ignored", name)
+            continue
+        providers.append(provider)
+    return providers
+
+
+def inference_stats() -> dict[str, Any]:
+    scheduler = get_provider_scheduler()
+    return {
+        **get_inference_executor().stats(),
+        "providers": scheduler.stats() if scheduler else {},
+        "cache": _get_memory_cache().stats(),
+    }
+
+
+def _get_memory_cache() -> TTLCache:
+    global _memory_cache, _disk_cache
+    if _memory_cache is None:
+        with _executor_lock:
+            if _memory_cache is None:
+                config = current_app.config
+                directory = config.get("GPT_CACHE_DIR")
+                if directory:
+                    _disk_cache = DiskCache(
+                        Path(directory),
+                        ttl=config["GPT_CACHE_DISK_TTL"],
+                        max_bytes=config["GPT_CACHE_DISK_MAX_BYTES"],
+                    )
+                _memory_cache = TTLCache(
+                    maxsize=config["GPT_CACHE_SIZE"], ttl=config["GPT_CACHE_TTL"]
+                )
+    return _memory_cache
+
+
+def _model() -> Any:
+    """The g4f model object, or its name where this g4f release does not define it."""
+    return getattr(g4f.models, "gpt_4_turbo", None) or MODEL_NAME
+
+
+def completion_cache_key(prompt: str, prompt_type: str) -> str:
+    """Content address of a completion: model, prompt type and normalised prompt."""
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    model = getattr(_model(), "name", MODEL_NAME)
+    material = json.dumps([model, prompt_type, normalized], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf8")).hexdigest()
+
+
+def _cached_completion(key: str) -> str | None:
+    memory = _get_memory_cache()
+    text = memory.get(key)
+    if text is not MISSING:
+        return text
+    if _disk_cache is not None:
+        text = _disk_cache.get(key)
+        if text is not MISSING:
+            memory.set(key, text)
+            return text
+    return None
+
+
+def _store_completion(key: str, text: str) -> None:
+    if text == FALLBACK_TEXT:
+        return
+    _get_memory_cache().set(key, text)
+    if _disk_cache is not None:
+        _disk_cache.set(key, text)
+
 
 def build_prompt(text: str, prompt_type: Literal["text", "image"] = "text") -> str:
     if prompt_type == "image":
@@ -15,17 +148,100 @@ def build_prompt(text: str, prompt_type: Literal["text", "image"] = "text") -> s
     return text
 
 
-def generate_completion(prompt: str) -> str:
-    response = g4f.ChatCompletion.create(
-        model=g4f.models.gpt_4_turbo,
+def generate_completion(prompt: str, timeout: float | None = None) -> str:
+    scheduler = get_provider_scheduler()
+    if scheduler is None:
+        return _create_completion(prompt, None, timeout) or FALLBACK_TEXT
+    return scheduler.complete(
+        lambda provider: _create_completion(prompt, provider, timeout), timeout
+    )
+
+
+def _create_completion(prompt: str, provider: Any, timeout: float | None) -> str:
+    return g4f.ChatCompletion.create(
+        model=_model(),
         messages=[{"role": "user", "content": prompt}],
+        **({"provider": provider} if provider is not None else {}),
+        **({"timeout": timeout} if timeout else {}),
     )
-    return response or "Nao foi possivel processar"
 
 
-def gpt_input(text: str, prompt_type: Literal["text", "image"] = "text") -> str:
-    prompt = build_prompt(text, prompt_type)
+def _safe_completion(prompt: str, timeout: float | None) -> str:
     try:
-        return generate_completion(prompt)
+        return generate_completion(prompt, timeout)
     except Exception:  # pragma: no cover - defensive guard around external dependency
-        return "Nao foi possivel processar"
+        return FALLBACK_TEXT
+
+
+def gpt_input(
+    text: str,
+    prompt_type: Literal["text", "image"] = "text",
+    timeout: float | None = None,
+) -> str:
+    """Run a completion on the inference pool.
+
+    Raises :class:`~app.utils.concurrency.ExecutorSaturated` when the pool and
+    its queue are full and :class:`concurrent.futures.TimeoutError` when no
+    answer arrives within ``timeout`` seconds (``GPT_TIMEOUT`` by default).
+    """
+    if timeout is None:
+        timeout = current_app.config["GPT_TIMEOUT"]
+    prompt = build_prompt(text, prompt_type)
+    key = completion_cache_key(prompt, prompt_type)
+    cached = _cached_completion(key)
+    if cached is not None:
+        return cached
+
+    completion = get_inference_executor().run(_safe_completion, prompt, timeout, timeout=timeout)
+    _store_completion(key, completion)
+    return completion
+
+
+def stream_completion(
+    text: str,
+    prompt_type: Literal["text", "image"] = "text",
+    timeout: float | None = None,
+) -> Iterator[str]:
+    """Stream a completion chunk by chunk from the best-ranked provider.
+
+    The work is queued on the inference pool immediately, so saturation is
+    reported (as :class:`~app.utils.concurrency.ExecutorSaturated`) before
+    the caller starts its response. A cached completion is replayed whole.
+    """
+    if timeout is None:
+        timeout = current_app.config["GPT_TIMEOUT"]
+    prompt = build_prompt(text, prompt_type)
+    key = completion_cache_key(prompt, prompt_type)
+    cached = _cached_completion(key)
+    if cached is not None:
+        return iter([cached])
+
+    chunks = ChunkQueue()
+    get_inference_executor().submit(_produce_stream, prompt, key, timeout, chunks)
+    return chunks.iterate(timeout)
+
+
+def _produce_stream(prompt: str, key: str, timeout: float, chunks: ChunkQueue) -> None:
+    parts: list[str] = []
+    try:
+        scheduler = get_provider_scheduler()
+        ranked = scheduler.ranked() if scheduler else []
+        provider = scheduler.providers[ranked[0]] if ranked else None
+        for chunk in g4f.ChatCompletion.create(
+            model=_model(),
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **({"provider": provider} if provider is not None else {}),
+            timeout=timeout,
+        ):
+            if isinstance(chunk, str) and chunk:
+                parts.append(chunk)
+                chunks.put(chunk)
+    except Exception as exc:  # pragma: no cover - external dependency
+        chunks.close(exc)
+        return
+    if parts:
+        _store_completion(key, "".join(parts))
+    else:
+        chunks.put(FALLBACK_TEXT)
+    chunks.close()
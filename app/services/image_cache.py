@@ -0,0 +1,110 @@
+"""Content-addressed local cache for remote images served from /temp_image."""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+from flask import current_app
+
+from app.services.thumbnails import download_image
+from app.utils.storage import atomic_write_bytes
+
+
+# The only names fetch() produces: a SHA-256 digest plus a known extension.
+CACHED_NAME = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp|img)$")
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+class ImageCache:
+    """Images stored once under their SHA-256 and evicted LRU past ``max_bytes``.
+
+    ``urls/<sha256(url)>`` records which file a source URL resolved to, so
+    repeated URLs are answered from disk without any network access. Serving
+    a file refreshes its mtime, which is what eviction orders by.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 256 * 1024**2) -> None:
+        self.directory = directory
+        self.url_directory = directory / "urls"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.url_directory.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, url: str) -> str:
+        """Return the cached file name for ``url``, downloading it on first use."""
+        url_file = self.url_directory / hashlib.sha256(url.encode("utf8")).hexdigest()
+        try:
+            name = url_file.read_text(encoding="utf8").strip()
+        except FileNotFoundError:
+            name = ""
+        if name and self.touch(name):
+            return name
+
+        content = download_image(url)
+        name = hashlib.sha256(content).hexdigest() + _extension(content)
+        path = self.directory / name
+        if not path.exists():
+            atomic_write_bytes(path, content)
+        atomic_write_bytes(url_file, name.encode("utf8"))
+        self._evict()
+        return name
+
+    def touch(self, name: str) -> bool:
+        if not CACHED_NAME.match(name):
+            return False
+        try:
+            os.utime(self.directory / name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = []
+            for path in self.directory.iterdir():
+                if path.is_file() and not path.name.startswith("."):
+                    stat = path.stat()
+                    files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _mtime, size, _path in files)
+            if total <= self.max_bytes:
+                return
+            # Stale urls/ entries are harmless: a missing file triggers a refetch.
+            for _mtime, size, path in sorted(files):
+                if total <= self.max_bytes * 0.9:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+
+_caches: dict[str, ImageCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    config = current_app.config
+    location = config["IMAGE_CACHE_DIR"]
+    with _caches_lock:
+        cache = _caches.get(location)
+        if cache is None:
+            cache = _caches[location] = ImageCache(
+                Path(location), max_bytes=config["IMAGE_CACHE_MAX_BYTES"]
+            )
+        return cache
+
+
+def _extension(content: bytes) -> str:
+    for signature, extension in _SIGNATURES:
+        if content.startswith(signature):
+            return extension
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return ".webp"
+    return ".img"
@@ -1,13 +1,22 @@
 """Utilities for interacting with the Last.fm API and local mapping."""
 from __future__ import annotations
 
-import json
+import hashlib
+import threading
+import time
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Hashable, Iterable
 
 import requests
 from flask import current_app
 
+from app.extensions import http_client
+from app.services.registry import get_registry
+from app.utils.cache import MISSING, DiskCache, TTLCache
+from app.utils.concurrency import get_executor, submit_with_app_context
+from app.utils.ratelimit import TokenBucket
+from app.utils.singleflight import SingleFlight
+from app.utils.storage import file_lock
 from app.utils.time import formatted_brazil_time
 
 
@@ -15,87 +24,384 @@ class LastFMError(RuntimeError):
     """Raised when an interaction with the Last.fm API fails."""
 
 
-def _database_path() -> Path:
-    return Path(current_app.config["DATABASE_FM"])
+# Request priorities for the outbound rate budget: lower goes first.
+INTERACTIVE = 0
+BULK = 1
 
 
 def load_registry() -> list[dict[str, str]]:
-    path = _database_path()
-    if not path.exists() or path.stat().st_size == 0:
-        return []
-    with path.open("r", encoding="utf8") as handle:
-        try:
-            return json.load(handle)
-        except json.JSONDecodeError:
-            return []
+    return get_registry().entries()
 
 
 def save_registry(entries: Iterable[dict[str, str]]) -> None:
-    path = _database_path()
-    with path.open("w", encoding="utf8") as handle:
-        json.dump(list(entries), handle, ensure_ascii=False)
+    get_registry().replace(entries)
 
 
 def upsert_user(phone_number: str, username: str) -> None:
-    entries = load_registry()
-    for entry in entries:
-        if entry["phone_number"] == phone_number:
-            entry.update({"user": username, "last_change": formatted_brazil_time()})
-            break
-    else:
-        entries.append(
-            {
-                "phone_number": phone_number,
-                "user": username,
-                "last_change": formatted_brazil_time(),
-            }
-        )
-    save_registry(entries)
+    get_registry().upsert(
+        {
+            "phone_number": phone_number,
+            "user": username,
+            "last_change": formatted_brazil_time(),
+        }
+    )
 
 
 def lookup_user(phone_number: str) -> str | None:
-    entries = load_registry()
-    for entry in entries:
-        if entry.get("phone_number") == phone_number:
-            return entry.get("user")
-    return None
+    entry = get_registry().get(phone_number)
+    return entry.get("user") if entry else None
+
+
+def lookup_users(phone_numbers: Iterable[str]) -> dict[str, str]:
+    """Map each registered number to its username; unknown numbers are left out."""
+    entries = get_registry().get_many(phone_numbers)
+    return {number: entry["user"] for number, entry in entries.items() if entry.get("user")}
+
+
+_response_cache: TTLCache | None = None
+_response_cache_lock = threading.Lock()
+_flights = SingleFlight()
+_shared_cache: DiskCache | None = None
+_shared_stats = {"upstream_calls": 0, "shared_hits": 0}
+_LOCK_MAX_AGE = 600
+_locks_pruned_at = 0.0
+_rate_limiter: TokenBucket | None = None
+_last_known: TTLCache | None = None
+_revalidating: set[Hashable] = set()
+_stale_stats = {"revalidations": 0, "stale_served": 0}
+
+# Top-list kind → (API method, response key, item key).
+TOP_LISTS = {
+    "albums": ("user.gettopalbums", "topalbums", "album"),
+    "tracks": ("user.gettoptracks", "toptracks", "track"),
+    "artists": ("user.gettopartists", "topartists", "artist"),
+}
+
+
+def _get_response_cache() -> TTLCache:
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = TTLCache(
+                    maxsize=current_app.config.get("LASTFM_CACHE_SIZE", 2048),
+                    ttl=current_app.config.get("LASTFM_CACHE_DEFAULT_TTL", 60),
+                )
+    return _response_cache
+
+
+def _cache_key(method: str, params: dict[str, Any]) -> Hashable:
+    # Last.fm treats user, artist and track names case-insensitively.
+    normalized = tuple(
+        sorted((key, str(value).strip().casefold()) for key, value in params.items())
+    )
+    return method.lower(), normalized
+
+
+def _get_shared_cache() -> DiskCache | None:
+    global _shared_cache
+    directory = current_app.config.get("LASTFM_SHARED_DIR")
+    if not directory:
+        return None
+    if _shared_cache is None:
+        with _response_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = DiskCache(Path(directory), ttl=60)
+    return _shared_cache
+
+
+def _get_rate_limiter() -> TokenBucket:
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _response_cache_lock:
+            if _rate_limiter is None:
+                config = current_app.config
+                shared = config.get("LASTFM_SHARED_DIR")
+                _rate_limiter = TokenBucket(
+                    config["LASTFM_RATE_LIMIT"],
+                    config["LASTFM_RATE_BURST"],
+                    reserve=config["LASTFM_RATE_BULK_RESERVE"],
+                    state_path=Path(shared) / "rate_budget.json" if shared else None,
+                )
+    return _rate_limiter
+
+
+def _get_last_known() -> TTLCache:
+    global _last_known
+    if _last_known is None:
+        with _response_cache_lock:
+            if _last_known is None:
+                _last_known = TTLCache(
+                    maxsize=current_app.config.get("LASTFM_CACHE_SIZE", 2048),
+                    ttl=current_app.config["LASTFM_STALE_TTL"],
+                )
+    return _last_known
+
+
+def stale_stats() -> dict[str, Any]:
+    with _response_cache_lock:
+        return {**_stale_stats, "revalidating": len(_revalidating)}
+
+
+def rate_limit_stats() -> dict[str, Any]:
+    return _get_rate_limiter().stats()
+
+
+def cache_stats() -> dict[str, Any]:
+    return _get_response_cache().stats()
+
+
+def flight_stats() -> dict[str, Any]:
+    """How many identical upstream calls were coalesced, in-process and across workers."""
+    with _response_cache_lock:
+        shared = dict(_shared_stats)
+    return {**_flights.stats(), **shared}
+
+
+def call_lastfm(
+    method: str, *, use_cache: bool = True, priority: int = INTERACTIVE, **params: Any
+) -> dict[str, Any]:
+    """Call the Last.fm API, serving repeated calls from a per-method TTL cache.
+
+    ``use_cache=False`` skips the lookup but still refreshes the cached entry.
+    Upstream calls draw from a shared rate budget; ``priority`` (``INTERACTIVE``
+    or ``BULK``) orders waiting calls. Raises :class:`LastFMError` when no
+    budget frees up within ``LASTFM_RATE_QUEUE_TIMEOUT``.
+    """
+    ttl = current_app.config.get("LASTFM_CACHE_TTLS", {}).get(method)
+    cache = _get_response_cache()
+    key = _cache_key(method, params)
+    if use_cache and ttl:
+        cached = cache.get(key)
+        if cached is not MISSING:
+            return cached
+
+    def fetch() -> dict[str, Any]:
+        data = _fetch_shared(method, key, ttl, use_cache, priority, params)
+        # Last.fm reports some failures (unknown user, ...) with a 200 and an
+        # "error" field; those must not be cached.
+        if ttl and "error" not in data:
+            cache.set(key, data, ttl)
+        return data
 
+    # Concurrent identical calls in this process share one upstream request.
+    # Priority is part of the key: an interactive call must not end up waiting
+    # behind the bulk budget of a background call it joined.
+    return _flights.do((key, use_cache, priority), fetch)
 
-def call_lastfm(method: str, **params: Any) -> dict[str, Any]:
+
+def _fetch_shared(
+    method: str,
+    key: Hashable,
+    ttl: int | None,
+    use_cache: bool,
+    priority: int,
+    params: dict[str, Any],
+) -> dict[str, Any]:
+    """Fetch ``method``, letting one worker process call upstream per key.
+
+    With ``LASTFM_SHARED_DIR`` set, the fetching worker holds a lock file
+    named after the key while it calls Last.fm and leaves the answer in a
+    shared on-disk cache, so workers that queued up behind it reuse that
+    answer instead of repeating the call. The token wait happens before the
+    lock, so it never blocks others on that key, and the token is refunded
+    when the answer turns up in the shared cache meanwhile.
+    """
+    shared = _get_shared_cache() if ttl else None
+    if shared is None:
+        _acquire_budget(method, priority)
+        return _count_upstream(method, params)
+
+    digest = hashlib.sha256(repr(key).encode("utf8")).hexdigest()
+    if use_cache:
+        data = _shared_hit(shared, digest)
+        if data is not MISSING:
+            return data
+    _acquire_budget(method, priority)
+    lock_path = shared.directory / "locks" / f"{digest}.lock"
+    with file_lock(lock_path):
+        lock_path.touch()
+        if use_cache:
+            data = _shared_hit(shared, digest)
+            if data is not MISSING:
+                _get_rate_limiter().refund()
+                return data
+        data = _count_upstream(method, params)
+        if "error" not in data:
+            shared.set(digest, data, ttl)
+    _prune_locks(lock_path.parent)
+    return data
+
+
+def _shared_hit(shared: DiskCache, digest: str) -> Any:
+    data = shared.get(digest)
+    if data is not MISSING:
+        with _response_cache_lock:
+            _shared_stats["shared_hits"] += 1
+    return data
+
+
+def _prune_locks(directory: Path) -> None:
+    """Drop per-key lock files nobody has used for ``_LOCK_MAX_AGE`` seconds.
+
+    Runs at most once per ``_LOCK_MAX_AGE`` per process. Fetches refresh the
+    lock file's mtime while holding it, so only long-idle keys are removed.
+    """
+    global _locks_pruned_at
+    now = time.time()
+    with _response_cache_lock:
+        if now - _locks_pruned_at < _LOCK_MAX_AGE:
+            return
+        _locks_pruned_at = now
+    for path in directory.glob("*.lock"):
+        try:
+            if now - path.stat().st_mtime > _LOCK_MAX_AGE:
+                path.unlink()
+        except OSError:
+            continue
+
+
+def _acquire_budget(method: str, priority: int) -> None:
+    timeout = current_app.config["LASTFM_RATE_QUEUE_TIMEOUT"]
+    if not _get_rate_limiter().acquire(priority, timeout=timeout):
+        raise LastFMError(f"Last.fm rate budget exhausted for {timeout}s ({method})")
+
+
+def _count_upstream(method: str, params: dict[str, Any]) -> dict[str, Any]:
+    with _response_cache_lock:
+        _shared_stats["upstream_calls"] += 1
+    return _fetch_lastfm(method, **params)
+
+
+def _fetch_lastfm(method: str, **params: Any) -> dict[str, Any]:
     payload = {
         "api_key": current_app.config.get("LASTFM_API_KEY"),
         "format": "json",
         **params,
     }
-    response = requests.get(
+    response = http_client.get(
+        "lastfm",
         "https://ws.audioscrobbler.com/2.0/",
         params={"method": method, **payload},
-        timeout=30,
     )
     response.raise_for_status()
     return response.json()
 
 
-def get_recent_track(username: str) -> dict[str, Any] | None:
-    data = call_lastfm("user.getrecenttracks", user=username, limit=1)
+def get_recent_track(
+    username: str, *, use_cache: bool = True, priority: int = INTERACTIVE
+) -> dict[str, Any] | None:
+    data = call_lastfm(
+        "user.getrecenttracks", use_cache=use_cache, priority=priority, user=username, limit=1
+    )
     tracks = data.get("recenttracks", {}).get("track", [])
     return tracks[0] if tracks else None
 
 
-def get_top_albums(username: str) -> list[dict[str, Any]]:
-    data = call_lastfm("user.gettopalbums", user=username)
-    return data.get("topalbums", {}).get("album", [])
+def get_top_list(
+    kind: str, username: str, *, use_cache: bool = True, priority: int = INTERACTIVE
+) -> tuple[list[dict[str, Any]], bool]:
+    """Return a user's top ``kind`` list and whether it is stale.
+
+    Lists are served stale-while-revalidate: past their cache TTL the last
+    known list is returned at once, flagged as stale, while a background call
+    refreshes it. If Last.fm cannot be reached the refresh keeps failing and
+    the list keeps being served stale for up to ``LASTFM_STALE_TTL`` seconds
+    before the error surfaces.
+    """
+    method, response_key, item_key = TOP_LISTS[kind]
+    data, stale = _call_stale_while_revalidate(
+        method, use_cache=use_cache, priority=priority, user=username
+    )
+    return data.get(response_key, {}).get(item_key, []), stale
+
+
+def get_top_albums(
+    username: str, *, use_cache: bool = True, priority: int = INTERACTIVE
+) -> list[dict[str, Any]]:
+    return get_top_list("albums", username, use_cache=use_cache, priority=priority)[0]
+
+
+def get_top_tracks(
+    username: str, *, use_cache: bool = True, priority: int = INTERACTIVE
+) -> list[dict[str, Any]]:
+    return get_top_list("tracks", username, use_cache=use_cache, priority=priority)[0]
+
 
+def get_top_artists(
+    username: str, *, use_cache: bool = True, priority: int = INTERACTIVE
+) -> list[dict[str, Any]]:
+    return get_top_list("artists", username, use_cache=use_cache, priority=priority)[0]
 
-def get_top_tracks(username: str) -> list[dict[str, Any]]:
-    data = call_lastfm("user.gettoptracks", user=username)
-    return data.get("toptracks", {}).get("track", [])
 
+def _call_stale_while_revalidate(
+    method: str, *, use_cache: bool, priority: int, **params: Any
+) -> tuple[dict[str, Any], bool]:
+    soft_ttl = current_app.config.get("LASTFM_CACHE_TTLS", {}).get(method, 0)
+    last_known = _get_last_known()
+    key = _cache_key(method, params)
+    entry = last_known.get(key)
+    if use_cache and entry is not MISSING:
+        fetched_at, data = entry
+        if time.time() - fetched_at < soft_ttl:
+            return data, False
+        _revalidate(method, key, params)
+        _count_stale()
+        return data, True
 
-def get_top_artists(username: str) -> list[dict[str, Any]]:
-    data = call_lastfm("user.gettopartists", user=username)
-    return data.get("topartists", {}).get("artist", [])
+    try:
+        data = call_lastfm(method, use_cache=use_cache, priority=priority, **params)
+    except (requests.RequestException, LastFMError):
+        if entry is MISSING:
+            raise
+        _count_stale()
+        return entry[1], True
+    if "error" not in data:
+        last_known.set(key, (time.time(), data))
+    return data, False
 
 
-def get_track_info(username: str, artist: str, track: str) -> dict[str, Any]:
-    return call_lastfm("track.getInfo", user=username, artist=artist, track=track).get("track", {})
+def _count_stale() -> None:
+    with _response_cache_lock:
+        _stale_stats["stale_served"] += 1
+
+
+def _revalidate(method: str, key: Hashable, params: dict[str, Any]) -> None:
+    with _response_cache_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+        _stale_stats["revalidations"] += 1
+    executor = get_executor("lastfm-revalidate", max_workers=4)
+    submit_with_app_context(executor, _refresh_last_known, method, key, params)
+
+
+def _refresh_last_known(method: str, key: Hashable, params: dict[str, Any]) -> None:
+    try:
+        data = call_lastfm(method, use_cache=False, priority=BULK, **params)
+        if "error" not in data:
+            _get_last_known().set(key, (time.time(), data))
+    except (requests.RequestException, LastFMError) as exc:  # pragma: no cover - network errors
+        current_app.logger.info("Background refresh of %s failed: %s", method, exc)
+    finally:
+        with _response_cache_lock:
+            _revalidating.discard(key)
+
+
+def get_track_info(
+    username: str,
+    artist: str,
+    track: str,
+    *,
+    use_cache: bool = True,
+    priority: int = INTERACTIVE,
+) -> dict[str, Any]:
+    data = call_lastfm(
+        "track.getInfo",
+        use_cache=use_cache,
+        priority=priority,
+        user=username,
+        artist=artist,
+        track=track,
+    )
+    return data.get("track", {})
@@ -0,0 +1,302 @@
+"""Background watcher that pushes now-playing changes of registered users."""
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import wait
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import requests
+from flask import Flask, current_app
+
+from app.extensions import http_client
+from app.services import lastfm
+from app.utils.concurrency import get_executor, submit_with_app_context
+from app.utils.scheduler import PeriodicTask
+from app.utils.storage import atomic_write_text, file_lock, file_signature, try_file_lock
+from app.utils.time import formatted_brazil_time
+
+
+class EventLog:
+    """Bounded log of now-playing events shared by worker processes through a file.
+
+    Events get increasing ids so stream clients can resume with ``Last-Event-ID``.
+    """
+
+    def __init__(self, path: Path, max_events: int = 200) -> None:
+        self.path = path
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._events: list[dict[str, Any]] = []
+        self._signature: tuple[int, int, int] | None = None
+
+    def append(self, events: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Number and store ``events``, returning them with their ids."""
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            next_id = self._events[-1]["id"] + 1 if self._events else 1
+            events = [{"id": next_id + index, **event} for index, event in enumerate(events)]
+            self._events = (self._events + events)[-self.max_events :]
+            atomic_write_text(self.path, json.dumps(self._events, ensure_ascii=False))
+            self._signature = file_signature(self.path)
+        return events
+
+    def since(self, last_id: int) -> list[dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return [event for event in self._events if event["id"] > last_id]
+
+    def last_id(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._events[-1]["id"] if self._events else 0
+
+    def _refresh(self) -> None:
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        try:
+            events = json.loads(self.path.read_text(encoding="utf8") or "[]")
+        except (FileNotFoundError, json.JSONDecodeError):
+            events = []
+        self._events = events if isinstance(events, list) else []
+
+
+@dataclass
+class WatchedUser:
+    username: str
+    numbers: list[str]
+    interval: float
+    next_due: float
+    track: tuple[str, str] | None = None
+    now_playing: bool = False
+    seen: bool = False
+    errors: int = field(default=0, repr=False)
+
+
+class NowPlayingWatcher:
+    """Poll ``user.getrecenttracks`` for every registered user on an adaptive schedule.
+
+    Users that are playing something are polled every ``fast`` seconds.
+    Idle users start at ``idle`` and back off by doubling up to
+    ``max_interval``; any change brings them back to ``fast``. Calls run at
+    ``BULK`` priority so they only use rate budget that interactive requests
+    leave over. Only one worker process (the holder of ``lock_path``)
+    watches at a time.
+    """
+
+    def __init__(
+        self,
+        events: EventLog,
+        lock_path: Path,
+        *,
+        fast: float = 15.0,
+        idle: float = 60.0,
+        max_interval: float = 900.0,
+        workers: int = 4,
+        webhook_url: str = "",
+    ) -> None:
+        self.events = events
+        self.lock_path = lock_path
+        self.fast = fast
+        self.idle = idle
+        self.max_interval = max_interval
+        self.workers = workers
+        self.webhook_url = webhook_url
+        self._users: dict[str, WatchedUser] = {}
+        self._leadership: ExitStack | None = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self.polls = 0
+        self.emitted = 0
+        self.failures = 0
+
+    @property
+    def leader(self) -> bool:
+        return self._leadership is not None
+
+    def tick(self) -> float:
+        """Poll every due user and return the delay until the next one is due."""
+        if not self._claim_leadership():
+            return self.idle
+
+        now = time.monotonic()
+        if now - self._synced_at >= self.idle:
+            self._sync_users(now)
+            self._synced_at = now
+
+        due = [user for user in self._users.values() if user.next_due <= now]
+        if due:
+            executor = get_executor("nowplaying", max_workers=self.workers)
+            futures = {
+                submit_with_app_context(executor, self._poll_user, user): user for user in due
+            }
+            wait(futures)
+            events = [event for future in futures for event in (future.result() or [])]
+            if events:
+                self._publish(events)
+
+        if not self._users:
+            return self.idle
+        next_due = min(user.next_due for user in self._users.values())
+        return min(self.idle, max(0.5, next_due - time.monotonic()))
+
+    def stats(self) -> dict[str, Any]:
+        playing = sum(1 for user in self._users.values() if user.now_playing)
+        return {
+            "leader": self.leader,
+            "users": len(self._users),
+            "now_playing": playing,
+            "polls": self.polls,
+            "events": self.emitted,
+            "failures": self.failures,
+        }
+
+    def _claim_leadership(self) -> bool:
+        if self._leadership is not None:
+            return True
+        stack = ExitStack()
+        if stack.enter_context(try_file_lock(self.lock_path)):
+            # Keep the lock for the life of the process; a new leader takes
+            # over when this one exits.
+            self._leadership = stack
+            return True
+        stack.close()
+        return False
+
+    def _sync_users(self, now: float) -> None:
+        numbers_by_user: dict[str, list[str]] = {}
+        for entry in lastfm.load_registry():
+            if entry.get("user") and entry.get("phone_number"):
+                numbers_by_user.setdefault(entry["user"], []).append(entry["phone_number"])
+
+        for username in list(self._users):
+            if username not in numbers_by_user:
+                del self._users[username]
+        for username, numbers in numbers_by_user.items():
+            user = self._users.get(username)
+            if user is None:
+                # Spread first polls out instead of hitting everyone at once.
+                self._users[username] = WatchedUser(
+                    username, numbers, self.idle, now + random.uniform(0, self.idle)
+                )
+            else:
+                user.numbers = numbers
+
+    def _poll_user(self, user: WatchedUser) -> list[dict[str, Any]]:
+        with self._lock:
+            self.polls += 1
+        try:
+            track = lastfm.get_recent_track(user.username, priority=lastfm.BULK)
+        except (requests.RequestException, lastfm.LastFMError) as exc:
+            with self._lock:
+                self.failures += 1
+            user.errors += 1
+            user.interval = min(self.max_interval, max(self.idle, user.interval * 2))
+            user.next_due = time.monotonic() + user.interval
+            current_app.logger.debug("Now-playing poll for %s failed: %s", user.username, exc)
+            return []
+
+        user.errors = 0
+        events = self._observe(user, track)
+        if user.now_playing or events:
+            user.interval = self.fast
+        else:
+            user.interval = min(self.max_interval, max(self.idle, user.interval * 2))
+        user.next_due = time.monotonic() + user.interval
+        return events
+
+    def _observe(self, user: WatchedUser, track: dict[str, Any] | None) -> list[dict[str, Any]]:
+        key = None
+        now_playing = False
+        if track:
+            key = (track.get("artist", {}).get("#text", ""), track.get("name", ""))
+            now_playing = track.get("@attr", {}).get("nowplaying", "false") == "true"
+
+        changed = (key, now_playing) != (user.track, user.now_playing)
+        first, was_playing = not user.seen, user.now_playing
+        user.seen, user.track, user.now_playing = True, key, now_playing
+        # The first observation only establishes a baseline.
+        if first or not changed or not track:
+            return []
+        if now_playing:
+            return [self._event("playing", user, track)]
+        return [self._event("stopped", user, track)] if was_playing else []
+
+    def _event(self, kind: str, user: WatchedUser, track: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "event": kind,
+            "user": user.username,
+            "numbers": list(user.numbers),
+            "track_name": track.get("name"),
+            "artist": track.get("artist", {}).get("#text"),
+            "album": track.get("album", {}).get("#text"),
+            "now_playing": kind == "playing",
+            "image_url": (track.get("image") or [{}])[-1].get("#text", ""),
+            "detected_at": formatted_brazil_time(),
+        }
+
+    def _publish(self, events: list[dict[str, Any]]) -> None:
+        events = self.events.append(events)
+        self.emitted += len(events)
+        if not self.webhook_url:
+            return
+        for event in events:
+            try:
+                http_client.post("callbacks", self.webhook_url, json=event).raise_for_status()
+            except requests.RequestException as exc:  # pragma: no cover - network errors
+                current_app.logger.warning("Now-playing webhook failed: %s", exc)
+
+
+_event_logs: dict[str, EventLog] = {}
+_watcher: NowPlayingWatcher | None = None
+_watcher_task: PeriodicTask | None = None
+_watcher_lock = threading.Lock()
+
+
+def get_event_log() -> EventLog:
+    location = current_app.config["NOWPLAYING_EVENTS_FILE"]
+    with _watcher_lock:
+        log = _event_logs.get(location)
+        if log is None:
+            log = _event_logs[location] = EventLog(Path(location))
+        return log
+
+
+def start_watcher(app: Flask) -> PeriodicTask | None:
+    """Start the now-playing watcher once per process when it is enabled."""
+    global _watcher, _watcher_task
+    config = app.config
+    if not config.get("NOWPLAYING_WATCH_ENABLED") or watcher_running():
+        return _watcher_task
+    with app.app_context():
+        events = get_event_log()
+    with _watcher_lock:
+        if _watcher_task is None:
+            _watcher = NowPlayingWatcher(
+                events,
+                events.path.with_name(f"{events.path.name}.watcher.lock"),
+                fast=config["NOWPLAYING_FAST_INTERVAL"],
+                idle=config["NOWPLAYING_IDLE_INTERVAL"],
+                max_interval=config["NOWPLAYING_MAX_INTERVAL"],
+                workers=config["NOWPLAYING_WORKERS"],
+                webhook_url=config["NOWPLAYING_WEBHOOK_URL"],
+            )
+            _watcher_task = PeriodicTask(app, "nowplaying-watcher", _watcher.tick, 1.0)
+    _watcher_task.start()
+    return _watcher_task
+
+
+def watcher_running() -> bool:
+    return _watcher_task is not None and _watcher_task.running
+
+
+def watcher_stats() -> dict[str, Any]:
+    return _watcher.stats() if _watcher is not None else {"leader": False}
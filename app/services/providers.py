@@ -0,0 +1,218 @@
+"""Latency-aware selection of g4f providers."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from app.utils.concurrency import get_executor
+
+
+logger = logging.getLogger(__name__)
+
+
+class NoProviderAvailable(RuntimeError):
+    """Raised when every provider failed or is behind an open circuit."""
+
+
+@dataclass
+class ProviderStats:
+    name: str
+    latency: float | None = None
+    error_rate: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+
+    def score(self, default_latency: float) -> float:
+        # Untried providers are scored with the prior so they still get traffic.
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1.0 + 4.0 * self.error_rate)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "failures": self.failures,
+            "circuit_open": self.open_until > time.monotonic(),
+        }
+
+
+class ProviderScheduler:
+    """Pick, race and circuit-break g4f providers by their observed behaviour.
+
+    Each provider keeps an exponentially weighted latency and error rate.
+    Prompts go to the best ``race`` providers at once and the first non-empty
+    answer wins; slower attempts are abandoned (threads cannot be killed, but
+    their outcome still feeds the statistics). Concurrent prompts share
+    providers, up to ``max_in_flight`` attempts each. Attempts still running
+    at the deadline count as failures, and a provider is not tried again
+    until those have returned, so a hung provider cannot tie up the race
+    pool. A provider failing ``failure_threshold`` times in a row is
+    skipped for ``cooldown`` seconds, after which a single call is let
+    through to probe it.
+    """
+
+    def __init__(
+        self,
+        providers: list[Any],
+        *,
+        race: int = 1,
+        alpha: float = 0.2,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        default_latency: float = 10.0,
+        max_in_flight: int = 4,
+    ) -> None:
+        self.providers = {_provider_name(provider): provider for provider in providers}
+        self.race = max(1, race)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.default_latency = default_latency
+        self.max_in_flight = max(1, max_in_flight)
+        self._stats = {name: ProviderStats(name) for name in self.providers}
+        self._running = {name: 0 for name in self.providers}
+        self._hung = {name: 0 for name in self.providers}
+        self._lock = threading.Lock()
+
+    def ranked(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            available = [
+                stats
+                for stats in self._stats.values()
+                if stats.open_until <= now and self._accepts(stats.name)
+            ]
+            available.sort(key=lambda stats: stats.score(self.default_latency))
+            return [stats.name for stats in available]
+
+    def complete(self, call: Callable[[Any], str], timeout: float | None = None) -> str:
+        """Run ``call(provider)`` on the best providers until one answers."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        candidates = self.ranked()
+        if not candidates:
+            raise NoProviderAvailable(self._unavailable_reason())
+
+        # Attempts per provider are capped, so this bounds the pool.
+        executor = get_executor(
+            "g4f-race", max_workers=len(self.providers) * self.max_in_flight
+        )
+        pending: dict[Future, tuple[str, threading.Event, float]] = {}
+        while candidates or pending:
+            while candidates and len(pending) < self.race:
+                name = candidates.pop(0)
+                future, abandoned = self._submit(executor, name, call)
+                if future is not None:
+                    pending[future] = (name, abandoned, time.monotonic())
+
+            if not pending:
+                break
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                pending.pop(future)
+                if future.exception() is None and future.result():
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+
+        for future, (name, abandoned, started) in pending.items():
+            if future.cancel():
+                continue
+            # Still running at the deadline: count it as a failure now, ignore
+            # whatever it eventually returns and keep the provider out until then.
+            with self._lock:
+                if future.done():
+                    continue  # Finished meanwhile and recorded its own outcome.
+                abandoned.set()
+                self._hung[name] += 1
+            self._record(name, time.monotonic() - started, ok=False, timed_out=True)
+        raise NoProviderAvailable("No g4f provider answered in time")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    **stats.as_dict(),
+                    "running": self._running[name],
+                    "hung": self._hung[name],
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def _submit(
+        self, executor: ThreadPoolExecutor, name: str, call: Callable[[Any], str]
+    ) -> tuple[Future | None, threading.Event]:
+        abandoned = threading.Event()
+        with self._lock:
+            if not self._accepts(name):
+                return None, abandoned
+            self._running[name] += 1
+        future = executor.submit(self._attempt, name, call, abandoned)
+        future.add_done_callback(lambda _future: self._finished(name, abandoned))
+        return future, abandoned
+
+    def _finished(self, name: str, abandoned: threading.Event) -> None:
+        with self._lock:
+            self._running[name] -= 1
+            if abandoned.is_set():
+                self._hung[name] -= 1
+
+    def _accepts(self, name: str) -> bool:
+        # Callers hold self._lock.
+        return not self._hung[name] and self._running[name] < self.max_in_flight
+
+    def _unavailable_reason(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if all(stats.open_until > now for stats in self._stats.values()):
+                return "All g4f providers are circuit-broken"
+        return "All g4f providers are busy or still running timed-out attempts"
+
+    def _attempt(self, name: str, call: Callable[[Any], str], abandoned: threading.Event) -> str:
+        started = time.monotonic()
+        try:
+            result = call(self.providers[name])
+        except Exception as exc:
+            if not abandoned.is_set():
+                self._record(name, time.monotonic() - started, ok=False)
+            logger.debug("g4f provider %s failed: %s", name, exc)
+            raise
+        if not abandoned.is_set():
+            self._record(name, time.monotonic() - started, ok=bool(result))
+        return result
+
+    def _record(self, name: str, elapsed: float, ok: bool, timed_out: bool = False) -> None:
+        with self._lock:
+            stats = self._stats[name]
+            stats.calls += 1
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok or timed_out:
+                # A timeout is at least that slow, so it also pushes the latency up.
+                stats.latency = (
+                    elapsed
+                    if stats.latency is None
+                    else stats.latency + self.alpha * (elapsed - stats.latency)
+                )
+            if ok:
+                stats.consecutive_failures = 0
+                stats.open_until = 0.0
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.open_until = time.monotonic() + self.cooldown
+                # Half-open: one more failure after the cooldown re-opens it.
+                stats.consecutive_failures = self.failure_threshold - 1
+
+
+def _provider_name(provider: Any) -> str:
+    return getattr(provider, "__name__", None) or type(provider).__name__
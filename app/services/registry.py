@@ -0,0 +1,375 @@
+"""Storage engines for the phone number → Last.fm username registry.
+
+File backends are selected by ``REGISTRY_STORAGE``:
+
+``json``
+    The whole registry lives in the ``DATABASE_FM`` snapshot and every write
+    rewrites it.
+``journal``
+    Upserts are appended to ``<DATABASE_FM>.journal`` and periodically
+    compacted into the snapshot, so a registration costs O(1).
+
+Both keep the registry in memory, indexed by phone number, and share the same
+JSON snapshot format so existing ``DATABASE_FM.json`` files load unchanged.
+
+Pointing ``DATABASE_FM`` at a ``sqlite:///`` URI selects :class:`SqliteRegistry`
+instead, which lets several workers read and upsert without holding the whole
+registry in memory.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from flask import current_app
+
+from app.utils.storage import atomic_write_text, file_lock, file_signature
+
+
+Entry = dict[str, str]
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class JsonRegistry:
+    """Registry loaded once from the JSON snapshot and indexed by phone number.
+
+    The file is only re-read when its mtime, size or inode changes, so lookups
+    are dictionary hits in steady state. Writes go through an atomic replace.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self._lock = threading.RLock()
+        self._entries: dict[str, Entry] = {}
+        self._signature: tuple[int, int, int] | None = None
+
+    def get(self, phone_number: str) -> Entry | None:
+        with self._lock:
+            self._refresh()
+            return self._entries.get(phone_number)
+
+    def get_many(self, phone_numbers: Iterable[str]) -> dict[str, Entry]:
+        """Look up several numbers under one lock and one freshness check."""
+        with self._lock:
+            self._refresh()
+            return {
+                number: self._entries[number]
+                for number in phone_numbers
+                if number in self._entries
+            }
+
+    def entries(self) -> list[Entry]:
+        with self._lock:
+            self._refresh()
+            return [dict(entry) for entry in self._entries.values()]
+
+    def upsert(self, entry: Entry) -> None:
+        with self._writing():
+            self._refresh()
+            self._entries[entry["phone_number"]] = merged = {
+                **self._entries.get(entry["phone_number"], {}),
+                **entry,
+            }
+            self._record(merged)
+
+    def replace(self, entries: Iterable[Entry]) -> None:
+        with self._writing():
+            self._entries = _index(entries)
+            self._write_snapshot()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        # The file lock serialises writers across gunicorn workers so that
+        # concurrent registrations cannot lose each other's updates.
+        with self._lock, file_lock(self.lock_path):
+            yield
+
+    def _refresh(self) -> None:
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        self._entries = _index(_read_snapshot(self.path))
+        self._signature = signature
+
+    def _record(self, entry: Entry) -> None:
+        self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
+        atomic_write_text(
+            self.path, json.dumps(list(self._entries.values()), ensure_ascii=False)
+        )
+        self._signature = file_signature(self.path)
+
+
+class JournalRegistry(JsonRegistry):
+    """Snapshot plus an append-only journal of upserts.
+
+    Each upsert appends one JSON line to the journal. Once the journal holds
+    ``compact_threshold`` records it is folded into a fresh snapshot, written
+    with an atomic rename *before* the journal is truncated; replaying a
+    journal over a snapshot that already contains it is idempotent, so a crash
+    at any point leaves a consistent registry.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        compact_threshold: int = 1000,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync!r}")
+        super().__init__(path)
+        self.journal_path = path.with_name(f"{path.name}.journal")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._last_fsync = 0.0
+
+    def compact(self) -> None:
+        with self._writing():
+            self._refresh()
+            self._compact()
+
+    def replace(self, entries: Iterable[Entry]) -> None:
+        with self._writing():
+            self._entries = _index(entries)
+            self._compact()
+
+    def _refresh(self) -> None:
+        signature = file_signature(self.path)
+        journal_size = _file_size(self.journal_path)
+        if signature != self._signature or journal_size < self._journal_offset:
+            self._entries = _index(_read_snapshot(self.path))
+            self._signature = signature
+            self._journal_offset = 0
+            self._journal_records = 0
+        if journal_size > self._journal_offset:
+            self._replay_journal()
+
+    def _replay_journal(self) -> None:
+        with self.journal_path.open("rb") as handle:
+            handle.seek(self._journal_offset)
+            chunk = handle.read()
+        complete = chunk.rfind(b"\n") + 1
+        for line in chunk[:complete].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn write from a crashed worker; the record was never acknowledged.
+                continue
+            phone_number = entry.get("phone_number") if isinstance(entry, dict) else None
+            if phone_number:
+                self._entries[phone_number] = entry
+                self._journal_records += 1
+        self._journal_offset += complete
+
+    def _record(self, entry: Entry) -> None:
+        line = json.dumps(entry, ensure_ascii=False).encode("utf8") + b"\n"
+        if _file_size(self.journal_path) > self._journal_offset:
+            # Only an unterminated torn line can remain after _refresh; keep
+            # our record on its own line.
+            line = b"\n" + line
+
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            if self._should_fsync():
+                os.fsync(fd)
+                self._last_fsync = time.monotonic()
+        finally:
+            os.close(fd)
+
+        self._journal_offset = _file_size(self.journal_path)
+        self._journal_records += 1
+        if self._journal_records >= self.compact_threshold:
+            self._compact()
+
+    def _should_fsync(self) -> bool:
+        if self.fsync == "always":
+            return True
+        if self.fsync == "interval":
+            return time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _compact(self) -> None:
+        self._write_snapshot()
+        with self.journal_path.open("wb") as handle:
+            os.fsync(handle.fileno())
+        self._journal_offset = 0
+        self._journal_records = 0
+
+
+class SqliteRegistry:
+    """Registry stored in SQLite (WAL mode) with one connection per thread.
+
+    ``phone_number`` is the table's primary key, so lookups and upserts are
+    index operations. Statements are fixed strings and therefore hit the
+    per-connection statement cache of :mod:`sqlite3` after the first call.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS registry ("
+        " phone_number TEXT PRIMARY KEY,"
+        " user TEXT NOT NULL,"
+        " last_change TEXT"
+        ") WITHOUT ROWID"
+    )
+    _SELECT_ONE = "SELECT phone_number, user, last_change FROM registry WHERE phone_number = ?"
+    _SELECT_ALL = "SELECT phone_number, user, last_change FROM registry"
+    _UPSERT = (
+        "INSERT INTO registry (phone_number, user, last_change) VALUES (?, ?, ?)"
+        " ON CONFLICT(phone_number) DO UPDATE SET"
+        " user = excluded.user, last_change = excluded.last_change"
+    )
+    _DELETE_ALL = "DELETE FROM registry"
+
+    def __init__(self, path: Path, *, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(self._SCHEMA)
+
+    def get(self, phone_number: str) -> Entry | None:
+        row = self._connection().execute(self._SELECT_ONE, (phone_number,)).fetchone()
+        return _row_to_entry(row) if row else None
+
+    def get_many(self, phone_numbers: Iterable[str]) -> dict[str, Entry]:
+        numbers = list(dict.fromkeys(phone_numbers))
+        found: dict[str, Entry] = {}
+        connection = self._connection()
+        # Stay well below SQLite's limit on bound parameters per statement.
+        for start in range(0, len(numbers), 500):
+            chunk = numbers[start : start + 500]
+            query = f"{self._SELECT_ALL} WHERE phone_number IN ({', '.join('?' * len(chunk))})"
+            for row in connection.execute(query, chunk):
+                found[row[0]] = _row_to_entry(row)
+        return found
+
+    def entries(self) -> list[Entry]:
+        return [_row_to_entry(row) for row in self._connection().execute(self._SELECT_ALL)]
+
+    def upsert(self, entry: Entry) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(self._UPSERT, _entry_to_row(entry))
+
+    def replace(self, entries: Iterable[Entry]) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(self._DELETE_ALL)
+            connection.executemany(self._UPSERT, map(_entry_to_row, entries))
+
+    def import_entries(self, entries: Iterable[Entry]) -> None:
+        connection = self._connection()
+        with connection:
+            connection.executemany(self._UPSERT, map(_entry_to_row, entries))
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+Registry = JsonRegistry | SqliteRegistry
+
+SQLITE_SCHEME = "sqlite:///"
+
+
+def sqlite_path(location: str) -> Path | None:
+    """Return the database path of a ``sqlite:///`` URI, or ``None`` for plain paths."""
+    if not location.startswith(SQLITE_SCHEME):
+        return None
+    return Path(location[len(SQLITE_SCHEME):])
+
+
+_registries: dict[tuple[str, str], Registry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry() -> Registry:
+    """Return the process-wide registry for the configured database."""
+    config = current_app.config
+    location = config["DATABASE_FM"]
+    storage = config.get("REGISTRY_STORAGE", "json")
+    with _registries_lock:
+        registry = _registries.get((location, storage))
+        if registry is None:
+            registry = _registries[(location, storage)] = _open_registry(
+                location, storage, config
+            )
+        return registry
+
+
+def _open_registry(location: str, storage: str, config) -> Registry:
+    database = sqlite_path(location)
+    if database is not None:
+        return SqliteRegistry(database)
+    if storage == "json":
+        return JsonRegistry(Path(location))
+    if storage == "journal":
+        return JournalRegistry(
+            Path(location),
+            fsync=config.get("REGISTRY_FSYNC", "interval"),
+            fsync_interval=float(config.get("REGISTRY_FSYNC_INTERVAL", 1.0)),
+            compact_threshold=int(config.get("REGISTRY_COMPACT_THRESHOLD", 1000)),
+        )
+    raise ValueError(f"Unknown registry storage: {storage!r}")
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _read_snapshot(path: Path) -> list[Entry]:
+    if not path.exists() or path.stat().st_size == 0:
+        return []
+    with path.open("r", encoding="utf8") as handle:
+        try:
+            data = json.load(handle)
+        except json.JSONDecodeError:
+            return []
+    return data if isinstance(data, list) else []
+
+
+def _row_to_entry(row: tuple[str, str, str | None]) -> Entry:
+    phone_number, user, last_change = row
+    entry = {"phone_number": phone_number, "user": user}
+    if last_change is not None:
+        entry["last_change"] = last_change
+    return entry
+
+
+def _entry_to_row(entry: Entry) -> tuple[str, str, str | None]:
+    return entry["phone_number"], entry["user"], entry.get("last_change")
+
+
+def _index(entries: Iterable[Entry]) -> dict[str, Entry]:
+    indexed: dict[str, Entry] = {}
+    for entry in entries:
+        phone_number = entry.get("phone_number")
+        if phone_number:
+            indexed[phone_number] = dict(entry)
+    return indexed
@@ -0,0 +1,281 @@
+"""Opt-in local store of per-user scrobble counters built from Last.fm history."""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import requests
+from flask import Flask, current_app
+
+from app.services import lastfm
+from app.utils.cache import MISSING, TTLCache
+from app.utils.scheduler import PeriodicTask
+from app.utils.storage import atomic_write_text, file_lock, file_signature, try_file_lock
+
+
+PAGE_SIZE = 200  # Largest page user.getrecenttracks serves.
+_SEPARATOR = "\x1f"
+_SAFE_NAME = re.compile(r"^[a-z0-9_-]{1,64}$")
+
+
+@dataclass
+class UserScrobbles:
+    """Play counters for one user, keyed by case-folded names.
+
+    ``last_uts`` is the timestamp of the newest scrobble counted; ``complete``
+    turns true once the whole history has been ingested, and only then are
+    the counters used in place of upstream playcounts.
+    """
+
+    user: str
+    last_uts: int = 0
+    complete: bool = False
+    synced_at: float = 0.0
+    tracks: Counter = field(default_factory=Counter)
+    albums: Counter = field(default_factory=Counter)
+    artists: Counter = field(default_factory=Counter)
+
+    def add(self, track: dict[str, Any]) -> None:
+        artist = _fold(track.get("artist", {}).get("#text"))
+        album = _fold(track.get("album", {}).get("#text"))
+        name = _fold(track.get("name"))
+        if not artist:
+            return
+        self.artists[artist] += 1
+        if name:
+            self.tracks[artist + _SEPARATOR + name] += 1
+        if album:
+            self.albums[artist + _SEPARATOR + album] += 1
+
+    def playcount(self, kind: str, artist: str, name: str | None = None) -> int:
+        if kind == "artist":
+            return self.artists.get(_fold(artist), 0)
+        counters = self.tracks if kind == "track" else self.albums
+        return counters.get(_fold(artist) + _SEPARATOR + _fold(name), 0)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "user": self.user,
+            "last_uts": self.last_uts,
+            "complete": self.complete,
+            "synced_at": self.synced_at,
+            "tracks": self.tracks,
+            "albums": self.albums,
+            "artists": self.artists,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> UserScrobbles:
+        return cls(
+            user=data["user"],
+            last_uts=data.get("last_uts", 0),
+            complete=data.get("complete", False),
+            synced_at=data.get("synced_at", 0.0),
+            tracks=Counter(data.get("tracks", {})),
+            albums=Counter(data.get("albums", {})),
+            artists=Counter(data.get("artists", {})),
+        )
+
+
+class ScrobbleStore:
+    """One JSON file of counters per user, cached in memory until it changes.
+
+    Only the ``cache_size`` most recently used users stay in memory. A small
+    index file keeps each user's ``synced_at`` and ``complete`` so the sync
+    can pick whom to update without loading every counter file.
+    """
+
+    def __init__(self, directory: Path, cache_size: int = 64) -> None:
+        self.directory = directory
+        self.lock_path = directory / ".sync.lock"
+        self.index_path = directory / ".index.json"
+        self._cache = TTLCache(maxsize=cache_size, ttl=float("inf"))
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, username: str) -> UserScrobbles | None:
+        path = self._path(username)
+        signature = file_signature(path)
+        if signature is None:
+            return None
+        cached = self._cache.get(username.casefold())
+        if cached is not MISSING and cached[0] == signature:
+            return cached[1]
+        try:
+            scrobbles = UserScrobbles.from_dict(json.loads(path.read_text(encoding="utf8")))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        self._cache.set(username.casefold(), (signature, scrobbles))
+        return scrobbles
+
+    def save(self, scrobbles: UserScrobbles) -> None:
+        path = self._path(scrobbles.user)
+        atomic_write_text(path, json.dumps(scrobbles.as_dict(), ensure_ascii=False))
+        self._cache.set(scrobbles.user.casefold(), (file_signature(path), scrobbles))
+        with file_lock(self.index_path.with_name(".index.lock")):
+            index = self.index()
+            index[scrobbles.user.casefold()] = {
+                "synced_at": scrobbles.synced_at,
+                "complete": scrobbles.complete,
+            }
+            atomic_write_text(self.index_path, json.dumps(index, ensure_ascii=False))
+
+    def index(self) -> dict[str, dict[str, Any]]:
+        """Map case-folded usernames to their ``synced_at`` and ``complete`` flags."""
+        try:
+            return json.loads(self.index_path.read_text(encoding="utf8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def sync(self, username: str, max_pages: int) -> int:
+        """Count scrobbles newer than the stored ones, fetching at most ``max_pages``.
+
+        Pages are read oldest first within a fixed ``from``/``to`` window, so
+        an interrupted ingest resumes where it stopped. Returns the number of
+        pages fetched.
+        """
+        scrobbles = self.get(username) or UserScrobbles(username)
+        window = {"from": scrobbles.last_uts + 1, "to": int(time.time())}
+        # Page 1 holds the newest scrobbles but also tells how many pages exist.
+        newest = _recent_page(username, 1, window)
+        total_pages = int(newest.get("@attr", {}).get("totalPages") or 0)
+        older = list(range(total_pages, 1, -1))[: max(0, max_pages - 1)]
+        for page in older:
+            _count_page(scrobbles, _recent_page(username, page, window))
+        if len(older) >= total_pages - 1:
+            _count_page(scrobbles, newest)
+            scrobbles.complete = True
+        scrobbles.synced_at = time.time()
+        self.save(scrobbles)
+        return 1 + len(older)
+
+    def _path(self, username: str) -> Path:
+        name = username.casefold()
+        if not _SAFE_NAME.match(name):
+            name = hashlib.sha256(name.encode("utf8")).hexdigest()
+        return self.directory / f"{name}.json"
+
+
+def _recent_page(username: str, page: int, window: dict[str, int]) -> dict[str, Any]:
+    data = lastfm.call_lastfm(
+        "user.getrecenttracks",
+        use_cache=False,
+        priority=lastfm.BULK,
+        user=username,
+        limit=PAGE_SIZE,
+        page=page,
+        **window,
+    )
+    if "error" in data:
+        raise lastfm.LastFMError(data.get("message") or f"Last.fm error {data['error']}")
+    return data.get("recenttracks", {})
+
+
+def _count_page(scrobbles: UserScrobbles, data: dict[str, Any]) -> None:
+    tracks = data.get("track", [])
+    if isinstance(tracks, dict):  # A single result is not wrapped in a list.
+        tracks = [tracks]
+    for track in tracks:
+        uts = int(track.get("date", {}).get("uts") or 0)
+        # The now-playing entry has no date and is not a scrobble yet.
+        if uts:
+            scrobbles.add(track)
+            scrobbles.last_uts = max(scrobbles.last_uts, uts)
+
+
+def _fold(value: str | None) -> str:
+    return (value or "").strip().casefold()
+
+
+_stores: dict[str, ScrobbleStore] = {}
+_stores_lock = threading.Lock()
+_sync_task: PeriodicTask | None = None
+
+
+def get_store() -> ScrobbleStore | None:
+    """Return the scrobble store, or ``None`` when it is not enabled."""
+    config = current_app.config
+    if not config.get("SCROBBLE_STORE_ENABLED"):
+        return None
+    location = config["SCROBBLE_STORE_DIR"]
+    with _stores_lock:
+        store = _stores.get(location)
+        if store is None:
+            store = _stores[location] = ScrobbleStore(
+                Path(location), config["SCROBBLE_CACHE_SIZE"]
+            )
+        return store
+
+
+def has_counts(username: str) -> bool:
+    """Whether playcounts for ``username`` can be answered locally."""
+    store = get_store()
+    scrobbles = store.get(username) if store is not None else None
+    return scrobbles is not None and scrobbles.complete
+
+
+def local_playcount(kind: str, username: str, artist: str, name: str | None = None) -> str | None:
+    """Playcount of a ``track``, ``album`` or ``artist`` from the local store.
+
+    Returns ``None`` unless the store is enabled and the user's history has
+    been fully ingested, in which case callers fall back to Last.fm.
+    """
+    store = get_store()
+    scrobbles = store.get(username) if store is not None else None
+    if scrobbles is None or not scrobbles.complete:
+        return None
+    return str(scrobbles.playcount(kind, artist, name))
+
+
+def sync_registered_users() -> None:
+    """Bring registered users up to date, least recently synced first.
+
+    At most ``SCROBBLE_SYNC_MAX_PAGES`` pages are fetched per run, so a long
+    initial ingest is spread over several runs.
+    """
+    store = get_store()
+    if store is None:
+        return
+    # Only one worker process syncs at a time; counters live on disk.
+    with try_file_lock(store.lock_path) as acquired:
+        if not acquired:
+            return
+        usernames = {entry["user"] for entry in lastfm.load_registry() if entry.get("user")}
+        budget = current_app.config["SCROBBLE_SYNC_MAX_PAGES"]
+        interval = current_app.config["SCROBBLE_SYNC_INTERVAL"]
+        index = store.index()
+
+        def last_synced(username: str) -> float:
+            return index.get(username.casefold(), {}).get("synced_at", 0.0)
+
+        for username in sorted(usernames, key=last_synced):
+            if budget <= 0:
+                break
+            entry = index.get(username.casefold(), {})
+            # Unfinished ingests continue on every run; the rest wait for the interval.
+            if entry.get("complete") and time.time() - entry.get("synced_at", 0.0) < interval:
+                continue
+            try:
+                budget -= store.sync(username, max_pages=budget)
+            except (requests.RequestException, lastfm.LastFMError) as exc:
+                current_app.logger.warning("Scrobble sync for %s failed: %s", username, exc)
+
+
+def start_sync(app: Flask) -> PeriodicTask | None:
+    """Start the background scrobble sync once per process when the store is enabled."""
+    global _sync_task
+    if not app.config.get("SCROBBLE_STORE_ENABLED"):
+        return None
+    with _stores_lock:
+        if _sync_task is None:
+            _sync_task = PeriodicTask(
+                app, "scrobble-sync", sync_registered_users, app.config["SCROBBLE_SYNC_TICK"]
+            )
+    _sync_task.start()
+    return _sync_task
@@ -0,0 +1,97 @@
+"""Download, shrink and host game thumbnails, reusing earlier uploads."""
+from __future__ import annotations
+
+import hashlib
+import io
+
+from flask import current_app
+
+from app.extensions import http_client
+from app.services.freestuff import upload_thumbnail
+from app.utils.cache import MISSING, TTLCache
+from app.utils.singleflight import SingleFlight
+
+try:  # pragma: no cover - optional dependency
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow not installed
+    Image = None
+
+
+class ImageTooLarge(ValueError):
+    """Raised when a download exceeds ``THUMBNAIL_MAX_DOWNLOAD_BYTES``."""
+
+
+_hosted_by_hash = TTLCache(maxsize=512)
+_hosted_by_source = TTLCache(maxsize=512)
+_uploads = SingleFlight()
+
+
+def host_thumbnail(source_url: str) -> str:
+    """Return a hosted URL for the image at ``source_url``.
+
+    Uploads are cached by source URL and by content hash until shortly before
+    the ImgBB expiry, so the same artwork is only re-uploaded once it lapses.
+    """
+    hosted = _hosted_by_source.get(source_url)
+    if hosted is not MISSING:
+        return hosted
+
+    content = download_image(source_url)
+    digest = hashlib.sha256(content).hexdigest()
+    ttl = max(0, current_app.config["IMGBB_EXPIRATION"] - 60)
+    hosted = _hosted_by_hash.get(digest)
+    if hosted is MISSING:
+        # Concurrent resolutions of the same artwork share one upload;
+        # different images upload in parallel.
+        hosted = _uploads.do(digest, lambda: _upload(content, digest, ttl))
+    _hosted_by_source.set(source_url, hosted, ttl)
+    return hosted
+
+
+def _upload(content: bytes, digest: str, ttl: float) -> str:
+    hosted = _hosted_by_hash.get(digest)
+    if hosted is MISSING:
+        hosted = upload_thumbnail(shrink_image(content))
+        _hosted_by_hash.set(digest, hosted, ttl)
+    return hosted
+
+
+def download_image(url: str) -> bytes:
+    limit = current_app.config["THUMBNAIL_MAX_DOWNLOAD_BYTES"]
+    with http_client.get("images", url, stream=True) as response:
+        response.raise_for_status()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.extend(chunk)
+            if len(buffer) > limit:
+                raise ImageTooLarge(f"{url} is larger than {limit} bytes")
+    return bytes(buffer)
+
+
+def shrink_image(content: bytes) -> bytes:
+    """Fit the image into ``THUMBNAIL_SIZE`` and re-encode it as JPEG.
+
+    Falls back to the original bytes when Pillow is missing or cannot decode
+    the image.
+    """
+    if Image is None:
+        return content
+    width, height = current_app.config["THUMBNAIL_SIZE"]
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.thumbnail((width, height))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(
+                output,
+                format="JPEG",
+                quality=current_app.config["THUMBNAIL_JPEG_QUALITY"],
+                optimize=True,
+                progressive=True,
+            )
+    except Exception:  # pragma: no cover - corrupt or unsupported image
+        current_app.logger.debug("Could not re-encode thumbnail, uploading original")
+        return content
+    encoded = output.getvalue()
+    return encoded if len(encoded) < len(content) else content
@@ -0,0 +1,152 @@
+"""In-memory and on-disk caching helpers."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+
+from .storage import atomic_write_text
+
+
+MISSING: Any = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class DiskCache:
+    """JSON values stored one file per key, with a TTL and a total size cap.
+
+    Keys must be filesystem-safe (e.g. hex digests). Reads refresh a file's
+    mtime so that eviction, which removes the oldest files first once
+    ``max_bytes`` is exceeded, approximates LRU.
+    """
+
+    def __init__(
+        self, directory: Path, *, ttl: float = 86400.0, max_bytes: int = 64 * 1024**2
+    ) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._size = sum(path.stat().st_size for path in self._files())
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        path = self.directory / f"{key}.json"
+        try:
+            item = json.loads(path.read_text(encoding="utf8"))
+        except (FileNotFoundError, ValueError):
+            return default
+        if item.get("expires_at", 0) <= time.time():
+            self._remove(path)
+            return default
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # pragma: no cover - evicted concurrently
+            pass
+        return item.get("value", default)
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        path = self.directory / f"{key}.json"
+        payload = json.dumps(
+            {"expires_at": time.time() + (self.ttl if ttl is None else ttl), "value": value},
+            ensure_ascii=False,
+        )
+        with self._lock:
+            previous = path.stat().st_size if path.exists() else 0
+            atomic_write_text(path, payload)
+            self._size += path.stat().st_size - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self) -> list[Path]:
+        return [path for path in self.directory.glob("*.json") if path.is_file()]
+
+    def _remove(self, path: Path) -> None:
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                return
+            self._size -= size
+
+    def _evict(self) -> None:
+        # Re-stat the directory: other workers may share it.
+        files = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        self._size = sum(size for _mtime, size, _path in files)
+        for _mtime, size, path in files:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
@@ -0,0 +1,179 @@
+"""Helpers for running blocking upstream calls concurrently."""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable
+
+from flask import Flask, current_app, has_app_context
+
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str = "fanout", max_workers: int | None = None) -> ThreadPoolExecutor:
+    """Return a process-wide bounded thread pool, creating it on first use."""
+    executor = _executors.get(name)
+    if executor is not None:
+        return executor
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            workers = max_workers or current_app.config.get("FANOUT_MAX_WORKERS", 16)
+            executor = _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=name
+            )
+        return executor
+
+
+def submit_with_app_context(
+    executor: ThreadPoolExecutor, func: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Future:
+    """Submit ``func`` so that it runs inside the current application context."""
+    app = current_app._get_current_object()
+    return executor.submit(_call_in_app_context, app, func, args, kwargs)
+
+
+def gather(*calls: Callable[[], Any], timeout: float | None = None) -> list[Any]:
+    """Run independent calls concurrently and return their results in order.
+
+    The first failure is re-raised and every call that has not started yet is
+    cancelled, so one failing upstream does not keep the others queued.
+    """
+    executor = get_executor()
+    futures = [submit_with_app_context(executor, call) for call in calls]
+    try:
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        return [future.result(timeout=0) for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when a :class:`BoundedExecutor` has no free worker or queue slot."""
+
+
+class TaskExpired(FutureTimeoutError):
+    """Raised for a task whose deadline passed before a worker picked it up."""
+
+
+class BoundedExecutor:
+    """Fixed-size worker pool in front of a bounded queue.
+
+    ``submit`` fails fast with :class:`ExecutorSaturated` once ``workers +
+    queue_size`` tasks are pending instead of letting callers pile up. Tasks
+    still queued when their deadline passes are cancelled without running.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._submitted = 0
+        self._started = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._expired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(
+        self, func: Callable[..., Any], *args: Any, deadline: float | None = None, **kwargs: Any
+    ) -> Future:
+        """Queue ``func``; ``deadline`` is an absolute :func:`time.monotonic` value."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated(f"{self.name} executor is saturated")
+
+        app = current_app._get_current_object() if has_app_context() else None
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+
+        def run() -> Any:
+            started_at = time.monotonic()
+            waited = started_at - enqueued_at
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._started += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                if deadline is not None and started_at >= deadline:
+                    raise TaskExpired(f"{self.name} task expired in queue")
+                if app is None:
+                    return func(*args, **kwargs)
+                return _call_in_app_context(app, func, args, kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run(
+        self, func: Callable[..., Any], *args: Any, timeout: float | None = None, **kwargs: Any
+    ) -> Any:
+        """Submit ``func`` and wait at most ``timeout`` seconds for its result."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        future = self.submit(func, *args, deadline=deadline, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            started = self._started
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "expired": self._expired,
+                "wait_avg_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                # Cancelled while queued: run() never executed.
+                self._queued -= 1
+                self._expired += 1
+            elif isinstance(future.exception(), TaskExpired):
+                self._expired += 1
+            elif future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._slots.release()
+
+
+def _call_in_app_context(
+    app: Flask, func: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]
+) -> Any:
+    with app.app_context():
+        return func(*args, **kwargs)
@@ -11,10 +11,16 @@ _ERROR_MESSAGES = {
     403: "Arquivo não encontrado.",
     404: "Dados não encontrados.",
     408: "Timeout.",
+    413: "Requisição grande demais.",
     500: "Erro interno do servidor.",
+    503: "Serviço sobrecarregado, tente novamente.",
 }
 
 
-def error_response(status_code: int):
+def error_payload(status_code: int) -> dict[str, str]:
     message = _ERROR_MESSAGES.get(status_code, "Erro desconhecido")
-    return jsonify({"error": str(status_code), "error_desc": message}), status_code
+    return {"error": str(status_code), "error_desc": message}
+
+
+def error_response(status_code: int):
+    return jsonify(error_payload(status_code)), status_code
@@ -0,0 +1,93 @@
+"""Pooled HTTP client shared by the upstream service wrappers."""
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+import requests
+from flask import Flask
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+Timeout = tuple[float, float]
+
+DEFAULT_TIMEOUT: Timeout = (3.05, 30.0)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HTTPClient:
+    """Keep-alive ``requests`` sessions, one per upstream service.
+
+    Each service gets its own session so connection pools (one per host inside
+    the adapter) and ``(connect, read)`` timeouts can be tuned independently.
+    Idempotent methods are retried with exponential backoff; POSTs never are.
+    """
+
+    def __init__(self, app: Flask | None = None) -> None:
+        self.pool_connections = 10
+        self.pool_maxsize = 32
+        self.retries = 2
+        self.backoff_factor = 0.3
+        self.timeouts: dict[str, Timeout] = {}
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.pool_connections = app.config.get("HTTP_POOL_CONNECTIONS", self.pool_connections)
+        self.pool_maxsize = app.config.get("HTTP_POOL_MAXSIZE", self.pool_maxsize)
+        self.retries = app.config.get("HTTP_RETRIES", self.retries)
+        self.backoff_factor = app.config.get("HTTP_BACKOFF_FACTOR", self.backoff_factor)
+        self.timeouts = dict(app.config.get("HTTP_TIMEOUTS", {}))
+        self.close()
+        app.extensions["http_client"] = self
+
+    def timeout(self, service: str) -> Timeout:
+        return self.timeouts.get(service) or self.timeouts.get("default") or DEFAULT_TIMEOUT
+
+    def session(self, service: str) -> requests.Session:
+        session = self._sessions.get(service)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(service)
+            if session is None:
+                session = self._sessions[service] = self._build_session()
+            return session
+
+    def request(self, service: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout(service))
+        return self.session(service).request(method, url, **kwargs)
+
+    def get(self, service: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request(service, "GET", url, **kwargs)
+
+    def post(self, service: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request(service, "POST", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
@@ -0,0 +1,138 @@
+"""Outbound rate limiting for upstream APIs."""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from .storage import file_lock
+
+
+class TokenBucket:
+    """Token bucket that makes callers wait, in priority order, for capacity.
+
+    ``rate`` tokens per second accrue up to ``burst``. Waiting callers form a
+    queue ordered by ``priority`` (lower first) and arrival, and only the head
+    of the queue draws tokens, so interactive work overtakes queued bulk work.
+    Callers with a priority above zero may not take the last ``reserve``
+    tokens, which keeps headroom for interactive calls from other processes.
+
+    With ``state_path`` the bucket is stored in that file, under a file lock,
+    so every worker process draws from the same budget.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        *,
+        reserve: float = 0.0,
+        state_path: Path | None = None,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.reserve = min(reserve, burst - 1)
+        self.state_path = state_path
+        self.lock_path = state_path.with_name(f"{state_path.name}.lock") if state_path else None
+        self._tokens = burst
+        self._updated = time.time()
+        self._condition = threading.Condition()
+        self._waiters: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self.acquired = 0
+        self.timeouts = 0
+        self.refunded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, priority: int = 0, timeout: float | None = None) -> bool:
+        """Take one token, waiting up to ``timeout`` seconds; return whether it was taken."""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    delay = None
+                    if self._waiters[0] == ticket:
+                        delay = self._take(priority)
+                        if delay == 0:
+                            self._record(time.monotonic() - started)
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            return False
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._condition.wait(delay)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def refund(self) -> None:
+        """Give back a token taken by :meth:`acquire` that ended up unused."""
+        with self._condition:
+            self.refunded += 1
+            self._update(self._refund_local)
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        with self._condition:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "waiting": len(self._waiters),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "refunded": self.refunded,
+                "wait_avg_ms": (
+                    round(self._wait_total / self.acquired * 1000, 2) if self.acquired else 0.0
+                ),
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+    def _take(self, priority: int) -> float:
+        """Take a token if one is available, else return seconds until one may be."""
+        return self._update(lambda: self._take_local(priority))
+
+    def _update(self, change: Callable[[], Any]) -> Any:
+        """Apply ``change`` to the bucket, reading and writing the shared state if any."""
+        if self.state_path is None:
+            return change()
+        with file_lock(self.lock_path):
+            try:
+                state = json.loads(self.state_path.read_text(encoding="utf8"))
+                self._tokens, self._updated = state["tokens"], state["updated"]
+            except (FileNotFoundError, ValueError, KeyError):
+                self._tokens, self._updated = self.burst, time.time()
+            result = change()
+            # The file is only ever read under the lock, so a plain write is enough.
+            self.state_path.write_text(
+                json.dumps({"tokens": self._tokens, "updated": self._updated}), encoding="utf8"
+            )
+        return result
+
+    def _take_local(self, priority: int) -> float:
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = now
+        floor = self.reserve if priority > 0 else 0.0
+        if self._tokens - 1 >= floor:
+            self._tokens -= 1
+            return 0.0
+        return (1 + floor - self._tokens) / self.rate
+
+    def _refund_local(self) -> None:
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def _record(self, waited: float) -> None:
+        self.acquired += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
@@ -0,0 +1,59 @@
+"""Background scheduling helpers."""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Callable
+
+from flask import Flask
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Run ``func`` every ``interval`` seconds on a daemon thread.
+
+    ``func`` runs inside an application context and may return the number of
+    seconds to wait before the next run, overriding ``interval`` once.
+    """
+
+    def __init__(
+        self, app: Flask, name: str, func: Callable[[], float | None], interval: float
+    ) -> None:
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            delay = self.interval
+            try:
+                with self.app.app_context():
+                    override = self.func()
+                if override is not None:
+                    delay = override
+            except Exception:  # pragma: no cover - keep the scheduler alive
+                logger.exception("Background task %s failed", self.name)
+            self._stop.wait(delay)
@@ -0,0 +1,79 @@
+"""Helpers for streaming partial results as Server-Sent Events."""
+from __future__ import annotations
+
+import json
+import queue
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Iterable, Iterator
+
+from flask import Response, request, stream_with_context
+
+from .errors import error_payload
+
+
+_DONE = object()
+
+
+class ChunkQueue:
+    """Hand text chunks from a worker thread or event loop to a response."""
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue[Any] = queue.Queue()
+
+    def put(self, chunk: str) -> None:
+        self._queue.put(chunk)
+
+    def close(self, error: BaseException | None = None) -> None:
+        self._queue.put(error if error is not None else _DONE)
+
+    def iterate(self, timeout: float | None = None) -> Iterator[str]:
+        """Yield chunks until the producer closes; ``timeout`` bounds the whole stream."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise FutureTimeoutError("stream deadline exceeded")
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                raise FutureTimeoutError("stream deadline exceeded") from None
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def wants_stream() -> bool:
+    return request.args.get("stream", "").lower() in {"1", "true", "yes", "sse"}
+
+
+def sse_event(payload: Any, event: str | None = None) -> str:
+    data = json.dumps(payload, ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+
+
+def stream_text(chunks: Iterable[str]) -> Iterator[str]:
+    """Frame text chunks as SSE, ending with a ``done`` frame carrying the full text."""
+    parts: list[str] = []
+    try:
+        for chunk in chunks:
+            if chunk:
+                parts.append(chunk)
+                yield sse_event({"text": chunk})
+    except FutureTimeoutError:
+        yield sse_event(error_payload(408), event="error")
+        return
+    except Exception:  # pragma: no cover - external service
+        yield sse_event(error_payload(500), event="error")
+        return
+    yield sse_event({"text": "".join(parts)}, event="done")
+
+
+def sse_response(frames: Iterable[str]) -> Response:
+    return Response(
+        stream_with_context(frames),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
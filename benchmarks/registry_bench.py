@@ -0,0 +1,103 @@
+"""Compare lookup/upsert latency of the registry backends.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.registry_bench
+    python -m benchmarks.registry_bench --sizes 1000 100000 --backends journal sqlite
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from app.services.registry import JournalRegistry, JsonRegistry, SqliteRegistry
+
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+BACKENDS = ("json", "journal", "sqlite")
+
+
+def _entries(count: int) -> list[dict[str, str]]:
+    return [
+        {
+            "phone_number": f"55{index:011d}",
+            "user": f"user{index}",
+            "last_change": "01-01-2024 00:00:00",
+        }
+        for index in range(count)
+    ]
+
+
+def _open(backend: str, directory: Path, entries: list[dict[str, str]]):
+    if backend == "sqlite":
+        registry = SqliteRegistry(directory / "registry.db")
+        registry.import_entries(entries)
+        return registry
+
+    path = directory / "DATABASE_FM.json"
+    path.write_text(json.dumps(entries, ensure_ascii=False), encoding="utf8")
+    if backend == "journal":
+        return JournalRegistry(path, fsync="interval", compact_threshold=10_000)
+    return JsonRegistry(path)
+
+
+def _measure(operation: Callable[[int], object], iterations: int) -> tuple[float, float]:
+    samples = []
+    for index in range(iterations):
+        start = time.perf_counter()
+        operation(index)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return mean * 1e6, p99 * 1e6
+
+
+def run(sizes: list[int], backends: list[str], lookups: int, upserts: int) -> None:
+    print(f"{'backend':<8} {'users':>9} {'load ms':>9} {'lookup us':>10} {'p99':>9} {'upsert us':>10} {'p99':>9}")
+    for size in sizes:
+        entries = _entries(size)
+        phones = [entry["phone_number"] for entry in entries]
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as tmp:
+                registry = _open(backend, Path(tmp), entries)
+
+                start = time.perf_counter()
+                registry.get(phones[0])  # first access pays the initial load
+                load_ms = (time.perf_counter() - start) * 1e3
+
+                rng = random.Random(size)
+                lookup = _measure(lambda _: registry.get(rng.choice(phones)), lookups)
+
+                # Rewriting the full snapshot per upsert does not scale; keep
+                # the json backend's sample small so the run stays bounded.
+                upsert_iterations = min(upserts, 20) if backend == "json" else upserts
+                upsert = _measure(
+                    lambda index: registry.upsert(
+                        {"phone_number": rng.choice(phones), "user": f"renamed{index}"}
+                    ),
+                    upsert_iterations,
+                )
+                print(
+                    f"{backend:<8} {size:>9} {load_ms:>9.1f} "
+                    f"{lookup[0]:>10.1f} {lookup[1]:>9.1f} {upsert[0]:>10.1f} {upsert[1]:>9.1f}"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--upserts", type=int, default=1_000)
+    args = parser.parse_args()
+    run(args.sizes, args.backends, args.lookups, args.upserts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,38 @@
-"""WSGI entry point."""
+"""WSGI/ASGI entry point."""
+from __future__ import annotations
+
+import argparse
+
 from app import app
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Floppa API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=887)
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="Serve through uvicorn instead of the Flask development server.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of uvicorn worker processes."
+    )
+    args = parser.parse_args()
+
+    if args.asgi:
+        import uvicorn
+
+        uvicorn.run(
+            "app.asgi:asgi_app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level=str(app.config["LOG_LEVEL"]).lower(),
+        )
+    else:
+        app.run(debug=True, host=args.host, port=args.port)
+
+
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=887)
+    main()